@@ -0,0 +1,58 @@
+from collections import Counter, defaultdict, deque
+from data_structures import ItemBatch
+
+
+def _free_units(units):
+    """Per-SKU queues of the not yet allocated units, in their original order."""
+    free = defaultdict(deque)
+    for unit in units:
+        free[unit.id].append(unit)
+    return free
+
+
+def allocate_units(orders, units, warehouses=None):
+    """
+    Assign ordered units to their order's warehouse in one pass over the order lines.
+
+    Every order line takes the next free units of its SKU. Units are numbered
+    per SKU (quantity_id 1, 2, ...) in allocation order, and each warehouse's
+    demand is rebuilt from the allocated units.
+
+    Args:
+        orders (list[Order]): Orders with (item_id, qty) lines.
+        units (ItemBatch | list[Item]): SKU table to create units from, or
+            already materialised units to pick from.
+        warehouses (list[Warehouse], optional): Warehouses whose demand is set.
+
+    Returns:
+        list[Item]: The allocated units.
+    """
+    is_table = isinstance(units, ItemBatch)
+    free = None if is_table else _free_units(units)
+    cursor = Counter()  # units allocated so far per SKU
+    demand = defaultdict(Counter)
+    items = []
+
+    for order in orders:
+        for item_id, quantity in order.items:
+            start = cursor[item_id]
+            if is_table:
+                allocated = units.expand(item_id, quantity, start)
+            else:
+                queue = free[item_id]
+                allocated = [queue.popleft() for _ in range(min(quantity, len(queue)))]
+            if len(allocated) < quantity:
+                raise ValueError(f"{order.name} asks for {quantity} units of item {item_id} "
+                                 f"but only {start + len(allocated)} are available in total")
+
+            for offset, item in enumerate(allocated, start=1):
+                item.warehouse_id = order.warehouse_id  # Assign the correct warehouse
+                item.quantity_id = start + offset  # Ensure unique quantity_id
+            cursor[item_id] += quantity
+            demand[order.warehouse_id][item_id] += quantity
+            items.extend(allocated)
+
+    for warehouse in warehouses or []:
+        warehouse.demand = dict(demand.get(warehouse.warehouse_id, {}))
+
+    return items
@@ -1,18 +1,68 @@
-import numpy as np
-from flask import Flask, request, jsonify
-from mpl_toolkits.mplot3d import Axes3D
-from mpl_toolkits.mplot3d.art3d import Poly3DCollection
-from pulp import LpProblem, LpMaximize, LpVariable, lpSum, GUROBI_CMD, value
-import matplotlib.colors as mcolors
-from matplotlib.path import Path
-from mpl_toolkits.mplot3d import proj3d
-import matplotlib.pyplot as plt
-from optimizer import optimize_routes
+from flask import Flask, request, jsonify, g, Response, stream_with_context
+from optimizer import distance_progress
 from data_structures import *
-from item_placement import optimize_packing
 from converter import *
+from ingest import read_solve_payload
+from pipeline import solve_payload, pack_payload, insert_payload
+from result_cache import solve_results, pack_results, request_key
+from jobs import job_queue, QueueFull
+from streaming import stream_format, solve_events, STREAM_FORMATS
+from response_encoding import iter_json, negotiate_encoding, compress, compress_stream, COMPRESS_MIN_BYTES
+from batch_packing import pack_batch, BatchError, PACK_TIME_LIMIT
+from tracing import span
+from deadline import parse_deadline_ms
+import metrics
+import io
 import json
+import os
+import time
+import uuid
 app = Flask(__name__)
+# Write every /solve problem instance to instance_snapshot.INSTANCE_DIR for replay
+# (python main.py --replay <file>). Single requests can ask with "captureSnapshot": true.
+app.config['CAPTURE_INSTANCES'] = os.environ.get('OPTISUPPLY_CAPTURE_INSTANCES') == '1'
+# gzip/deflate responses for clients that send Accept-Encoding
+app.config['COMPRESS_RESPONSES'] = os.environ.get('OPTISUPPLY_COMPRESS_RESPONSES', '1') == '1'
+
+@app.before_request
+def start_request_timer():
+    g.request_started_at = time.perf_counter()
+    g.request_endpoint = request.endpoint or 'unknown'
+    metrics.requests_in_progress.inc(endpoint=g.request_endpoint)
+
+@app.after_request
+def record_request_metrics(response):
+    metrics.requests_total.inc(endpoint=g.request_endpoint, code=response.status_code)
+    return response
+
+@app.after_request
+def compress_response(response):
+    if not app.config['COMPRESS_RESPONSES'] or 'Content-Encoding' in response.headers:
+        return response
+    if response.status_code < 200 or response.status_code in (204, 304):
+        return response
+    response.vary.add('Accept-Encoding')
+    encoding = negotiate_encoding(request.headers.get('Accept-Encoding'))
+    if encoding is None:
+        return response
+    if response.is_streamed:
+        # Each chunk is flushed, streamed events are not held back by the compressor
+        response.response = compress_stream(response.response, encoding)
+        response.headers.pop('Content-Length', None)
+    else:
+        data = response.get_data()
+        if len(data) < COMPRESS_MIN_BYTES:
+            return response
+        response.set_data(compress(data, encoding))
+    response.headers['Content-Encoding'] = encoding
+    return response
+
+@app.teardown_request
+def stop_request_timer(exc):
+    if 'request_started_at' not in g:
+        return
+    metrics.request_seconds.observe(time.perf_counter() - g.request_started_at, endpoint=g.request_endpoint)
+    metrics.requests_in_progress.dec(endpoint=g.request_endpoint)
 
 # class Item:
 #     def __init__(self, id, length, width, height, weight, stackable, fragile):
@@ -137,142 +187,123 @@ app = Flask(__name__)
 # def place_items(bin, items):
 #     optimize_packing(bin, items)
 
-def print_item_positions(bin):
-    positions = []
-    for item in bin.items:
-        if item.position is not None:
-            positions.append({
-                "id": item.id,
-                "position": item.position,
-                "dimensions": (item.length, item.width, item.height)
-            })
-    return positions
-def trucks_to_json(trucks):
-    trucks_data = []
-    print("############")
-    print(trucks)
-    print("############")
-
-    for truck in trucks:
-        truck_info = {
-            "truckId": truck.truck_id,
-            "items": [
-                {
-                    "itemId": item.id,
-                    "quantity_id": item.quantity_id,
-                    "position": item.position,
-                    "dimensions": (item.length, item.width, item.height),
-                    "supplier": item.supplier_id,
-                    "warehouse": item.warehouse_id
-                }
-                for item in truck.bin.items
-            ]
-        }
-        trucks_data.append(truck_info)
-    
-    return trucks_data
-
-
 @app.route('/solve',methods=['POST'])
 def solve():
-    data = request.json
-    trucks_data = data['trucks']
-    orders_data = data['orders']
-    suppliers_data=data['suppliers']
-    warehouses_data=data['warehouses']
-    items_data=data['items']
-    print("########trucks#########")
-    print(trucks_data)
-    print("########orders#########")
-    print(orders_data)
-    print("########suppliers#########")
-    print(suppliers_data)
-    print("########warehouses#########")
-    print(warehouses_data)
-    print("########Items#########")
-    print(items_data)
-    suppliers = convert_suppliers(suppliers_data)
-    trucks = convert_trucks(trucks_data)
-    orders = convert_orders(orders_data)
-    warehouses = convert_warehouses(warehouses_data)
-    all_items=convert_items(items_data)
-    items = []
-    for order in orders:
-        for item_id, quantity in order.items:
-            matching_items = [item for item in all_items if item.id == item_id and item not in items]
-            for i in range(quantity):
-                item = matching_items[i]
-                item.warehouse_id = order.warehouse_id  # Assign the correct warehouse
-                item.quantity_id = len([it for it in items if it.id == item_id]) + 1  # Ensure unique quantity_id
-                items.append(item)
-    for warehouse in warehouses:
-        warehouse.demand = {}
-        for item in items:
-            if item.warehouse_id == warehouse.warehouse_id:
-                if item.id in warehouse.demand:
-                    warehouse.demand[item.id] += 1
-                else:
-                    warehouse.demand[item.id] = 1
-    def debug_data(suppliers, warehouses, trucks, items):
-        print("Suppliers:")
-        for s in suppliers:
-            print(f"  {s.supplier_id}: {s.location}")
-        
-        print("\nWarehouses:")
-        for w in warehouses:
-            print(f"  {w.warehouse_id}: {w.location}")
-        
-        print("\nTrucks:")
-        for t in trucks:
-            print(f"  {t.truck_id}: Capacity {t.bin.length, t.bin.width, t.bin.height}")
-        
-        print("\nItems:")
-        for i in items:
-            print(f"  {i.id}-{i.quantity_id}: Volume {i.length, i.width, i.height}, Supplier {i.supplier_id}, Warehouse {i.warehouse_id}")
-
-        
-        print("\nWarehouses Demand:")
-        for w in warehouses:
-            print(f"Warehouse {w.warehouse_id} Demand: {w.demand}")
-        
-        print("\nSupplier Inventory:")
-        for s in suppliers:
-            print(f"Supplier {s.supplier_id} Inventory: {s.inventory}")
-
-    debug_data(suppliers, warehouses, trucks, items)
-    optimize_routes(suppliers, warehouses, trucks, orders, items)
-    for truck in trucks:
-        print(f"Truck {truck.truck_id} is carrying the following items:")
-        for item in truck.bin.items:
-            print(f"Item {item.id}-{item.quantity_id} from Supplier {item.supplier_id} to Warehouse {item.warehouse_id} "
-                  f"at position {item.position} with dimensions {item.length}x{item.width}x{item.height}.")
-        print()
-    result=trucks_to_json(trucks)
-    print(result)
-    # Create Trucks
-# trucks = [Truck(t['truckId'], t['name'], Bin(t['dim']['l'], t['dim']['b'], t['dim']['h'])) for t in trucks_data]
-
-    return jsonify({'data':result})
+    # The body is parsed straight from the request stream into model objects;
+    # send application/x-ndjson for very large order books
+    try:
+        with span("ingestion") as ingestion_span:
+            payload = read_solve_payload(request.stream, request.content_type, request.content_length)
+            ingestion_span.attrs["records"] = payload.records
+        parse_deadline_ms(payload.get('deadline_ms'))
+    except ValueError as e:
+        return jsonify({"status": "error", "message": str(e)}), 400
+    # Clients may pick the id themselves to poll /solve/progress/<id> while this runs
+    request_id = str(payload.get('requestId') or uuid.uuid4().hex)
+    capture = app.config['CAPTURE_INSTANCES'] or bool(payload.get('captureSnapshot'))
+
+    # ?format=compact groups each truck's units by SKU, supplier and warehouse with
+    # flat position arrays (pipeline.truck_to_compact_json)
+    compact = request.args.get('format') == 'compact'
+
+    # ?stream=ndjson|sse (or the matching Accept header) sends the assignment and each
+    # packed truck as soon as they are ready; streamed solves bypass the result cache
+    fmt = stream_format(request.args.get('stream'), request.headers.get('Accept'))
+    if fmt is not None:
+        events = solve_events(payload, request_id, fmt, capture=capture, ingestion_span=ingestion_span,
+                              compact=compact)
+        return Response(stream_with_context(events), mimetype=STREAM_FORMATS[fmt],
+                        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no', 'X-Request-Id': request_id})
+
+    def run():
+        return solve_payload(payload, request_id, capture=capture, ingestion_span=ingestion_span, compact=compact)
+
+    if capture:
+        # A snapshot needs a real solve
+        response = run()
+    else:
+        # Retries and unchanged re-plans (in any record order) are answered from the result cache
+        key = payload.cache_key() + (':compact' if compact else '')
+        response, source = solve_results.get_or_compute(key, run)
+        if source != 'miss':
+            response = {'data': response['data'], 'requestId': request_id, 'cached': True,
+                        **{key: response[key] for key in ('format', 'deadlineMs', 'degraded') if key in response}}
+    # Written truck by truck instead of as one string, large fleets make large bodies
+    return Response(iter_json(response), mimetype='application/json')
+
+@app.route('/solve/progress/<request_id>', methods=['GET'])
+def solve_progress(request_id):
+    progress = distance_progress.get(request_id)
+    if progress is None:
+        return jsonify({"status": "error", "message": f"No running solve with id {request_id}"}), 404
+    return jsonify({"status": "success", "requestId": request_id, "distances": progress.as_dict()})
+
+@app.route('/jobs', methods=['POST'])
+def submit_job():
+    # Same body as /solve; it is checked here, then parsed again and solved in a worker process
+    body = request.get_data()
+    try:
+        payload = read_solve_payload(io.BytesIO(body), request.content_type, len(body))
+        parse_deadline_ms(payload.get('deadline_ms'))
+    except ValueError as e:
+        return jsonify({"status": "error", "message": str(e)}), 400
+    try:
+        job = job_queue.submit(body, request.content_type, capture=app.config['CAPTURE_INSTANCES'])
+    except QueueFull as e:
+        return jsonify({"status": "error", "message": str(e)}), 429
+    return jsonify({"status": "success", "jobId": job.job_id, "state": job.state}), 202, {"Location": f"/jobs/{job.job_id}"}
+
+@app.route('/jobs/<job_id>', methods=['GET'])
+def job_status(job_id):
+    job = job_queue.get(job_id)
+    if job is None:
+        return jsonify({"status": "error", "message": f"No job with id {job_id}"}), 404
+    return jsonify({"status": "success", **job_queue.describe(job)})
+
+@app.route('/jobs/<job_id>', methods=['DELETE'])
+def cancel_job(job_id):
+    job = job_queue.get(job_id)
+    if job is None:
+        return jsonify({"status": "error", "message": f"No job with id {job_id}"}), 404
+    if job.done:
+        return jsonify({"status": "error", "message": f"Job {job_id} already {job.state}"}), 409
+    job_queue.cancel(job_id)
+    return jsonify({"status": "success", **job_queue.describe(job)}), 202
 
 @app.route('/pack', methods=['POST'])
 def pack():
     data = request.json
-    bin_data = data['bin']
-    items_data = data['items']
-    # print(items_data)
-    bin = Bin(bin_data['length'], bin_data['width'], bin_data['height'])
-    items = [Item(item['id'], item['l'], item['b'], item['h'], item['weight'], item['stackable'], item['fragile']) for item in items_data]
-    
-    print(items)
-    print('#####')
-    print(bin.length,bin.height,bin.width)
-    optimize_packing(bin, items)
-    # optimize_routes(suppliers, warehouses, trucks, orders, items)
-    
-
-    positions = print_item_positions(bin)
-    return jsonify({"status": "success", "positions": positions})
-    # return jsonify({"status": "success"})
+    # Retries of the same bin and items are answered from the result cache
+    response, source = pack_results.get_or_compute(request_key(data), lambda: pack_payload(data))
+    if source != 'miss':
+        # Timings belong to the request that computed the result, as for /solve
+        response = {"status": "success", "positions": response["positions"], "engine": response["engine"],
+                    "cached": True}
+    return jsonify(response)
+
+@app.route('/pack/insert', methods=['POST'])
+def pack_insert():
+    data = request.json or {}
+    try:
+        response = insert_payload(data)
+    except (KeyError, TypeError, ValueError) as e:
+        return jsonify({"status": "error", "message": f"Invalid insert request: {e}"}), 400
+    return jsonify(response)
+
+@app.route('/pack/batch', methods=['POST'])
+def pack_many():
+    data = request.json or {}
+    try:
+        results = pack_batch(data.get('jobs'), data.get('timeLimit', PACK_TIME_LIMIT))
+    except (BatchError, TypeError, ValueError) as e:
+        return jsonify({"status": "error", "message": str(e)}), 400
+    succeeded = sum(1 for result in results if result["status"] == "success")
+    return jsonify({"status": "success", "results": results, "succeeded": succeeded,
+                    "failed": len(results) - succeeded})
+
+@app.route('/metrics', methods=['GET'])
+def metrics_endpoint():
+    return Response(metrics.render(), mimetype='text/plain; version=0.0.4')
 
 if __name__ == '__main__':
     app.run(debug=True)
@@ -0,0 +1,210 @@
+import os, signal, threading, time, uuid
+from concurrent.futures import ProcessPoolExecutor, wait
+from concurrent.futures.process import BrokenProcessPool
+from tracing import span
+import metrics
+
+# Processes packing bins at the same time
+PACK_WORKERS = os.cpu_count() or 1
+
+# Solver time limit per job when the request does not set one, and the largest allowed (seconds)
+PACK_TIME_LIMIT = 60
+MAX_PACK_TIME_LIMIT = 600
+
+# Model building and extraction are not covered by the solver limit; a job still
+# running this long after its limit is stopped and reported as timed out (seconds)
+WALL_GRACE = 30
+
+# A job still running this long after its worker should have stopped it (in code
+# the timeout signal cannot interrupt) is reported as timed out, and the pool it
+# is stuck in is retired (seconds)
+STUCK_GRACE = 2 * WALL_GRACE
+
+# How often a batch checks its running jobs against their deadlines, and a retired
+# pool for other work still running on it (seconds)
+CHECK_INTERVAL = 5
+
+# Jobs accepted in one batch request
+MAX_BATCH_JOBS = 1000
+
+_executor = None
+_executor_lock = threading.Lock()
+_manager = None
+_started = None
+# Futures reported as stuck, across batches; their pools are retired
+_stuck = set()
+
+
+class BatchError(ValueError):
+    pass
+
+
+class JobTimeout(Exception):
+    pass
+
+
+def get_executor(broken=None):
+    """
+    The shared packing pool and the shared dict its workers record job start
+    times in, both started on first use. Pass a pool that raised BrokenProcessPool
+    as `broken` to replace it (unless another caller already has).
+
+    Returns:
+        tuple: (ProcessPoolExecutor, start times dict)
+    """
+    global _executor, _manager, _started
+    import multiprocessing
+
+    with _executor_lock:
+        context = multiprocessing.get_context('spawn')
+        if _manager is None:
+            _manager = context.Manager()
+            _started = _manager.dict()
+        if _executor is None or _executor is broken:
+            if _executor is not None:
+                _executor.shutdown(wait=False, cancel_futures=True)
+            _executor = ProcessPoolExecutor(PACK_WORKERS, mp_context=context)
+        return _executor, _started
+
+
+def _reap(executor):
+    """Kill the workers of a retired pool once only stuck jobs are left on it."""
+    # ProcessPoolExecutor has no public way to see its running calls or stop one
+    while any(item.future not in _stuck for item in list(executor._pending_work_items.values())):
+        time.sleep(CHECK_INTERVAL)
+    stuck = [item.future for item in list(executor._pending_work_items.values())]
+    for process in list((executor._processes or {}).values()):
+        process.kill()
+    with _executor_lock:
+        _stuck.difference_update(stuck)
+
+
+def _retire(executor, stuck):
+    """
+    Stop sending work to a pool with `stuck` jobs. Work other callers already
+    submitted to it still runs; its workers are killed once that has finished.
+    """
+    global _executor
+    with _executor_lock:
+        _stuck.update(stuck)
+        if _executor is executor:
+            _executor = None
+    executor.shutdown(wait=False)
+    threading.Thread(target=_reap, args=(executor,), name="pack-pool-reaper", daemon=True).start()
+
+
+def _job_timeout(signum, frame):
+    raise JobTimeout()
+
+
+def _pack_job(bin_data, items_data, time_limit, token, started_at):
+    """
+    Worker process entry point for one (bin, items) job. Its start time is kept
+    in `started_at[token]` while it runs. The job is stopped with JobTimeout once it has run
+    WALL_GRACE past its time limit, counted from when a worker picks it up rather
+    than from when it was queued.
+    """
+    from pipeline import pack_bin
+
+    started_at[token] = time.time()
+    started = time.perf_counter()
+    signal.signal(signal.SIGALRM, _job_timeout)
+    signal.setitimer(signal.ITIMER_REAL, time_limit + WALL_GRACE)
+    try:
+        positions, solver_status, engine = pack_bin(bin_data, items_data, time_limit)
+    finally:
+        signal.setitimer(signal.ITIMER_REAL, 0)
+        started_at.pop(token, None)
+    return {
+        "solverStatus": solver_status,
+        "engine": engine,
+        "positions": positions,
+        "placed": len(positions),
+        "items": len(items_data),
+        "seconds": round(time.perf_counter() - started, 3),
+    }
+
+
+def _time_limit(job, default):
+    if not isinstance(job, dict):
+        raise BatchError(f"Each job must be an object, got {type(job).__name__}")
+    try:
+        limit = float(job.get('timeLimit', default))
+    except (TypeError, ValueError):
+        raise BatchError(f"timeLimit must be a number, got {job.get('timeLimit', default)!r}")
+    if limit <= 0:
+        raise BatchError(f"timeLimit must be positive, got {limit}")
+    return min(limit, MAX_PACK_TIME_LIMIT)
+
+
+def pack_batch(jobs, time_limit=PACK_TIME_LIMIT):
+    """
+    Pack many bins in parallel.
+
+    Args:
+        jobs (list[dict]): {"id": optional, "bin": {...}, "items": [...], "timeLimit": optional}
+            in the /pack request format.
+        time_limit (float): Solver limit for jobs that do not set their own.
+
+    Returns:
+        list[dict]: One result per job, in request order, with "status" success, error or timeout.
+
+    Raises:
+        BatchError: The batch itself is malformed.
+    """
+    if not isinstance(jobs, list) or not jobs:
+        raise BatchError("'jobs' must be a non-empty list")
+    if len(jobs) > MAX_BATCH_JOBS:
+        raise BatchError(f"At most {MAX_BATCH_JOBS} jobs per batch, got {len(jobs)}")
+    limits = [_time_limit(job, time_limit) for job in jobs]
+
+    with span("pack_batch", jobs=len(jobs), workers=PACK_WORKERS):
+        batch_id = uuid.uuid4().hex
+        tokens = [f"{batch_id}:{index}" for index in range(len(jobs))]
+        executor, started_at = get_executor()
+        try:
+            futures = [executor.submit(_pack_job, job.get('bin'), job.get('items'), limit, token, started_at)
+                       for job, limit, token in zip(jobs, limits, tokens)]
+        except BrokenProcessPool:
+            executor, started_at = get_executor(broken=executor)
+            futures = [executor.submit(_pack_job, job.get('bin'), job.get('items'), limit, token, started_at)
+                       for job, limit, token in zip(jobs, limits, tokens)]
+
+        # Each job times itself out once running. A job still running STUCK_GRACE after
+        # that, counted from its own start, is stuck where the signal cannot reach it;
+        # jobs that are only queued (behind other callers' work) have no deadline yet
+        job_of = {future: index for index, future in enumerate(futures)}
+        pending = set(futures)
+        stuck = set()
+        while pending:
+            _, pending = wait(pending, timeout=CHECK_INTERVAL)
+            if not pending:
+                break
+            now = time.time()
+            starts = dict(started_at)
+            for future in list(pending):
+                index = job_of[future]
+                start = starts.get(tokens[index])
+                if start is not None and now > start + limits[index] + WALL_GRACE + STUCK_GRACE:
+                    stuck.add(future)
+                    pending.discard(future)
+        if stuck:
+            _retire(executor, stuck)
+            for future in stuck:
+                started_at.pop(tokens[job_of[future]], None)
+
+        results = []
+        for index, (job, future) in enumerate(zip(jobs, futures)):
+            result = {"id": job.get('id', index)}
+            if future.cancelled():
+                result.update(status="error", message="Job was cancelled when the packing pool was replaced")
+            elif future in stuck or isinstance(future.exception(), JobTimeout):
+                result.update(status="timeout", message="Job did not finish within its time limit")
+            elif future.exception() is not None:
+                error = future.exception()
+                result.update(status="error", message=f"{type(error).__name__}: {error}")
+            else:
+                result.update(status="success", **future.result())
+            metrics.pack_batch_jobs.inc(status=result["status"])
+            results.append(result)
+    return results
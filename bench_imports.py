@@ -0,0 +1,79 @@
+import json, os, statistics, subprocess, sys
+
+# Cold-import benchmark for the service and CLI entry points. Every run starts a
+# fresh interpreter, so the numbers match what a new gunicorn worker pays.
+#
+#   python bench_imports.py            # check budgets, exit 1 on a regression
+#   python bench_imports.py --verbose  # also list the slowest imports per module
+
+# Modules that must not be loaded just by importing an entry point
+HEAVY_MODULES = ['numpy', 'scipy', 'matplotlib', 'pulp', 'osmnx', 'networkx', 'geopy', 'pyproj']
+
+# Median cold import budget per entry point, in milliseconds
+IMPORT_BUDGET_MS = {
+    'app': 600,
+    'optimizer': 100,
+    'item_placement': 50,
+    'visualize': 50,
+    'main': 150,
+}
+
+RUNS = 5
+
+_PROBE = """
+import json, sys, time
+start = time.perf_counter()
+import {module}
+elapsed = time.perf_counter() - start
+print(json.dumps({{"ms": elapsed * 1000, "modules": sorted(sys.modules)}}))
+"""
+
+
+def measure(module, runs=RUNS):
+    """Import `module` in `runs` fresh interpreters; return the median time and loaded heavy modules."""
+    here = os.path.dirname(os.path.abspath(__file__))
+    timings = []
+    heavy = set()
+    for _ in range(runs):
+        output = subprocess.run([sys.executable, '-c', _PROBE.format(module=module)],
+                                cwd=here, capture_output=True, text=True, check=True).stdout
+        result = json.loads(output.strip().splitlines()[-1])
+        timings.append(result['ms'])
+        heavy.update(m for m in result['modules'] if m.split('.')[0] in HEAVY_MODULES)
+    return statistics.median(timings), sorted({m.split('.')[0] for m in heavy})
+
+
+def slowest_imports(module, top=10):
+    """Parse `python -X importtime` output and return the `top` slowest cumulative imports."""
+    here = os.path.dirname(os.path.abspath(__file__))
+    stderr = subprocess.run([sys.executable, '-X', 'importtime', '-c', f"import {module}"],
+                            cwd=here, capture_output=True, text=True, check=True).stderr
+    rows = []
+    for line in stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        _, cumulative, name = line[len('import time:'):].split('|')
+        rows.append((int(cumulative), name.strip()))
+    return sorted(rows, reverse=True)[:top]
+
+
+if __name__ == '__main__':
+    verbose = '--verbose' in sys.argv
+    failures = []
+    for module, budget in IMPORT_BUDGET_MS.items():
+        median_ms, heavy = measure(module)
+        status = 'ok'
+        if median_ms > budget:
+            status = 'SLOW'
+            failures.append(f"{module} took {median_ms:.0f}ms (budget {budget}ms)")
+        if heavy:
+            status = 'HEAVY'
+            failures.append(f"{module} loads {', '.join(heavy)} at import")
+        print(f"{module:<16} {median_ms:8.1f}ms  budget {budget}ms  {status}")
+        if verbose:
+            for cumulative, name in slowest_imports(module):
+                print(f"    {cumulative / 1000:8.1f}ms  {name}")
+
+    for failure in failures:
+        print(f"Regression: {failure}")
+    sys.exit(1 if failures else 0)
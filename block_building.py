@@ -0,0 +1,93 @@
+from data_structures import Item
+from tracing import span
+
+# Block building: identical boxes (same dimensions and flags) are combined into
+# rectangular n x m x k blocks that the packers place as single items, then the
+# blocks are expanded back into one position per unit. Boxes are only stacked
+# inside a block when they are stackable and not fragile, and a block is treated
+# as fragile / non-stackable on top when its units are.
+
+# Most units combined into one block; bigger blocks leave less room to fit around
+MAX_BLOCK_UNITS = 64
+
+# Largest block footprint as a share of the bin length and width. A block offers
+# one origin for optimize_packing's support rows, so floor-wide blocks would
+# leave nothing else able to stand on them.
+MAX_BLOCK_SPAN = 0.5
+
+
+class Block(Item):
+    """An n x m x k arrangement of identical units, packed as one item."""
+    __slots__ = ('units', 'shape')
+
+    def __init__(self, units, shape):
+        unit = units[0]
+        n, m, k = shape
+        super().__init__(unit.id, f"block{unit.quantity_id}", unit.length * n, unit.width * m, unit.height * k,
+                         sum(u.weight for u in units), unit.stackable, unit.fragile)
+        self.units = units
+        self.shape = shape
+
+
+def _block_shape(unit, count, bin):
+    """The (n, m, k) fitting in `bin` with the most units (at most `count`), flattest first."""
+    best = (1, 1, 1)
+    max_k = bin.height // unit.height if unit.stackable and not unit.fragile else 1
+    limit = min(count, MAX_BLOCK_UNITS)
+    max_n = max(1, int(bin.length * MAX_BLOCK_SPAN) // unit.length)
+    max_m = max(1, int(bin.width * MAX_BLOCK_SPAN) // unit.width)
+    for n in range(1, min(max_n, bin.length // unit.length, limit) + 1):
+        for m in range(1, min(max_m, bin.width // unit.width, limit // n) + 1):
+            k = min(max_k, limit // (n * m))
+            if k < 1:
+                continue
+            size = n * m * k
+            if (size, -k, n) > (best[0] * best[1] * best[2], -best[2], best[0]):
+                best = (n, m, k)
+    return best
+
+
+def build_blocks(bin, items):
+    """
+    Combine `items` into blocks for packing into `bin`. Units that are left over,
+    or have no identical partner, are returned as they are.
+
+    Returns:
+        list: Block and Item objects covering every unit of `items` once.
+    """
+    groups = {}
+    for item in items:
+        key = (item.length, item.width, item.height, bool(item.stackable), bool(item.fragile))
+        groups.setdefault(key, []).append(item)
+
+    objects = []
+    with span("block_building", items=len(items)) as block_span:
+        for units in groups.values():
+            while len(units) > 1:
+                shape = _block_shape(units[0], len(units), bin)
+                size = shape[0] * shape[1] * shape[2]
+                if size == 1:
+                    break
+                objects.append(Block(units[:size], shape))
+                units = units[size:]
+            objects.extend(units)
+        block_span.attrs["objects"] = len(objects)
+    return objects
+
+
+def expand_blocks(bin):
+    """Replace every Block in bin.items by its units, at their positions inside the block."""
+    expanded = []
+    for item in bin.items:
+        if not isinstance(item, Block):
+            expanded.append(item)
+            continue
+        x, y, z = item.position
+        n, m, k = item.shape
+        unit = item.units[0]
+        for index, u in enumerate(item.units):
+            i, rest = divmod(index, m * k)
+            j, q = divmod(rest, k)
+            u.position = (x + i * unit.length, y + j * unit.width, z + q * unit.height)
+            expanded.append(u)
+    bin.items = expanded
@@ -0,0 +1,316 @@
+import numpy as np
+import networkx as nx
+import heapq, json, os, random, shutil, time
+
+# Directory holding the serialized contraction hierarchy for the road graph
+CH_INDEX_DIR = 'ch_index'
+
+# Witness searches give up after settling this many nodes (adds a few extra shortcuts)
+WITNESS_SETTLE_LIMIT = 500
+
+_ARRAYS = ('node_ids', 'fwd_indptr', 'fwd_indices', 'fwd_weights',
+           'bwd_indptr', 'bwd_indices', 'bwd_weights')
+
+
+def _simple_adjacency(G, weight):
+    """Collapse a (multi)graph into out/in dicts of the cheapest edge per node pair."""
+    node_ids = np.array(sorted(G.nodes))
+    position = {node: idx for idx, node in enumerate(node_ids.tolist())}
+    n = len(node_ids)
+    out_adj = [dict() for _ in range(n)]
+    in_adj = [dict() for _ in range(n)]
+    for u, v, data in G.edges(data=True):
+        if u == v:
+            continue
+        a, b = position[u], position[v]
+        w = float(data.get(weight, 1.0))
+        if w < out_adj[a].get(b, float('inf')):
+            out_adj[a][b] = w
+            in_adj[b][a] = w
+    return node_ids, out_adj, in_adj
+
+
+def _witness_distance(source, target_set, limit, skip, out_adj):
+    """Dijkstra from source ignoring node `skip`, bounded by cost and settled nodes."""
+    dist = {source: 0.0}
+    heap = [(0.0, source)]
+    settled = 0
+    remaining = set(target_set)
+    while heap and remaining and settled < WITNESS_SETTLE_LIMIT:
+        d, u = heapq.heappop(heap)
+        if d > dist[u]:
+            continue
+        if d > limit:
+            break
+        settled += 1
+        remaining.discard(u)
+        for v, w in out_adj[u].items():
+            if v == skip:
+                continue
+            nd = d + w
+            if nd < dist.get(v, float('inf')):
+                dist[v] = nd
+                heapq.heappush(heap, (nd, v))
+    return dist
+
+
+def _shortcuts_for(v, out_adj, in_adj):
+    shortcuts = []
+    if not in_adj[v] or not out_adj[v]:
+        return shortcuts
+    max_out = max(out_adj[v].values())
+    for u, w_in in in_adj[v].items():
+        targets = [x for x in out_adj[v] if x != u]
+        if not targets:
+            continue
+        dist = _witness_distance(u, targets, w_in + max_out, v, out_adj)
+        for x in targets:
+            via = w_in + out_adj[v][x]
+            if dist.get(x, float('inf')) > via:
+                shortcuts.append((u, x, via))
+    return shortcuts
+
+
+def _priority(v, out_adj, in_adj, deleted_neighbours):
+    edge_difference = len(_shortcuts_for(v, out_adj, in_adj)) - len(in_adj[v]) - len(out_adj[v])
+    return edge_difference + deleted_neighbours[v]
+
+
+def _to_csr(edge_lists):
+    counts = [len(edges) for edges in edge_lists]
+    indptr = np.zeros(len(edge_lists) + 1, dtype=np.int64)
+    np.cumsum(counts, out=indptr[1:])
+    indices = np.fromiter((x for edges in edge_lists for x in edges), dtype=np.int32, count=int(indptr[-1]))
+    weights = np.fromiter((w for edges in edge_lists for w in edges.values()), dtype=np.float64, count=int(indptr[-1]))
+    return indptr, indices, weights
+
+
+def build_ch(G, weight='length'):
+    """
+    Contract the road graph into a contraction hierarchy.
+
+    Args:
+        G (networkx.MultiDiGraph): Road graph, e.g. from road_network.get_road_graph.
+        weight (str): Edge attribute holding the edge cost.
+
+    Returns:
+        dict: Arrays describing the upward (forward) and downward (backward) search graphs.
+    """
+    start = time.time()
+    node_ids, out_adj, in_adj = _simple_adjacency(G, weight)
+    n = len(node_ids)
+    deleted_neighbours = [0] * n
+    up_edges = [None] * n
+    down_edges = [None] * n
+
+    heap = [(_priority(v, out_adj, in_adj, deleted_neighbours), v) for v in range(n)]
+    heapq.heapify(heap)
+    order = 0
+    while heap:
+        _, v = heapq.heappop(heap)
+        # Lazy update: re-evaluate and postpone the node if it is no longer the cheapest
+        priority = _priority(v, out_adj, in_adj, deleted_neighbours)
+        if heap and priority > heap[0][0]:
+            heapq.heappush(heap, (priority, v))
+            continue
+
+        for u, x, w in _shortcuts_for(v, out_adj, in_adj):
+            if w < out_adj[u].get(x, float('inf')):
+                out_adj[u][x] = w
+                in_adj[x][u] = w
+
+        # All remaining neighbours are ranked higher than v
+        up_edges[v] = out_adj[v]
+        down_edges[v] = in_adj[v]
+        for x in out_adj[v]:
+            del in_adj[x][v]
+            deleted_neighbours[x] += 1
+        for u in in_adj[v]:
+            del out_adj[u][v]
+            deleted_neighbours[u] += 1
+        out_adj[v] = {}
+        in_adj[v] = {}
+        order += 1
+        if order % 10000 == 0:
+            print(f"Contracted {order}/{n} nodes")
+
+    fwd_indptr, fwd_indices, fwd_weights = _to_csr(up_edges)
+    bwd_indptr, bwd_indices, bwd_weights = _to_csr(down_edges)
+    print(f"Built contraction hierarchy for {n} nodes in {time.time() - start:.1f}s")
+    return {
+        'node_ids': node_ids,
+        'fwd_indptr': fwd_indptr, 'fwd_indices': fwd_indices, 'fwd_weights': fwd_weights,
+        'bwd_indptr': bwd_indptr, 'bwd_indices': bwd_indices, 'bwd_weights': bwd_weights,
+    }
+
+
+def save_ch(arrays, path=CH_INDEX_DIR, weight='length'):
+    """Write the index as plain .npy files so it can be memory-mapped, replacing any old index."""
+    tmp_path = path + '.tmp'
+    shutil.rmtree(tmp_path, ignore_errors=True)
+    os.makedirs(tmp_path)
+    for name in _ARRAYS:
+        np.save(os.path.join(tmp_path, f"{name}.npy"), arrays[name])
+    with open(os.path.join(tmp_path, 'meta.json'), 'w') as f:
+        json.dump({'nodes': len(arrays['node_ids']), 'weight': weight,
+                   'edges': int(len(arrays['fwd_indices']) + len(arrays['bwd_indices'])),
+                   'built_at': time.time()}, f)
+
+    old_path = path + '.old'
+    if os.path.exists(path):
+        os.replace(path, old_path)
+    os.replace(tmp_path, path)
+    shutil.rmtree(old_path, ignore_errors=True)
+
+
+class CHIndex:
+    """Read-only, memory-mapped contraction hierarchy answering road distance queries."""
+
+    def __init__(self, arrays, meta=None):
+        for name in _ARRAYS:
+            setattr(self, name, arrays[name])
+        self.meta = meta or {}
+
+    @classmethod
+    def load(cls, path=CH_INDEX_DIR):
+        arrays = {name: np.load(os.path.join(path, f"{name}.npy"), mmap_mode='r') for name in _ARRAYS}
+        with open(os.path.join(path, 'meta.json')) as f:
+            meta = json.load(f)
+        return cls(arrays, meta)
+
+    def __contains__(self, node):
+        idx = int(np.searchsorted(self.node_ids, node))
+        return idx < len(self.node_ids) and self.node_ids[idx] == node
+
+    def _position(self, node):
+        idx = int(np.searchsorted(self.node_ids, node))
+        if idx >= len(self.node_ids) or self.node_ids[idx] != node:
+            raise KeyError(f"Node {node} is not in the contraction hierarchy")
+        return idx
+
+    def _upward_search(self, start, indptr, indices, weights):
+        dist = {start: 0.0}
+        heap = [(0.0, start)]
+        while heap:
+            d, u = heapq.heappop(heap)
+            if d > dist[u]:
+                continue
+            a, b = indptr[u], indptr[u + 1]
+            for v, w in zip(indices[a:b].tolist(), weights[a:b].tolist()):
+                nd = d + w
+                if nd < dist.get(v, float('inf')):
+                    dist[v] = nd
+                    heapq.heappush(heap, (nd, v))
+        return dist
+
+    def _forward_space(self, node):
+        return self._upward_search(self._position(node), self.fwd_indptr, self.fwd_indices, self.fwd_weights)
+
+    def _backward_space(self, node):
+        return self._upward_search(self._position(node), self.bwd_indptr, self.bwd_indices, self.bwd_weights)
+
+    def distance(self, source, target):
+        """
+        Shortest road distance between two graph nodes.
+
+        Returns:
+            float: Distance in the index weight unit, inf if the target is unreachable.
+        """
+        if source == target:
+            return 0.0
+        forward = self._forward_space(source)
+        backward = self._backward_space(target)
+        if len(forward) > len(backward):
+            forward, backward = backward, forward
+        return min((d + backward[v] for v, d in forward.items() if v in backward), default=float('inf'))
+
+    def distance_matrix(self, sources, targets):
+        """
+        Many-to-many distances using one upward search per source and per target.
+
+        Returns:
+            numpy.ndarray: len(sources) x len(targets) matrix of distances.
+        """
+        buckets = {}
+        for j, target in enumerate(targets):
+            for v, d in self._backward_space(target).items():
+                buckets.setdefault(v, []).append((j, d))
+
+        matrix = np.full((len(sources), len(targets)), np.inf)
+        for i, source in enumerate(sources):
+            row = matrix[i]
+            for v, d in self._forward_space(source).items():
+                for j, db in buckets.get(v, ()):
+                    if d + db < row[j]:
+                        row[j] = d + db
+        return matrix
+
+
+def load_ch_index(path=CH_INDEX_DIR):
+    """Memory-map the index if it has been built, otherwise return None."""
+    if not os.path.exists(os.path.join(path, 'meta.json')):
+        return None
+    return CHIndex.load(path)
+
+
+def verify_against_dijkstra(index, G, samples=100, weight='length', seed=0, tolerance=1e-6):
+    """
+    Compare index distances with plain Dijkstra on random node pairs.
+
+    Returns:
+        list[tuple]: (source, target, index distance, dijkstra distance) for every mismatch.
+    """
+    rng = random.Random(seed)
+    nodes = list(G.nodes)
+    mismatches = []
+    for _ in range(samples):
+        source, target = rng.choice(nodes), rng.choice(nodes)
+        try:
+            expected = nx.shortest_path_length(G, source, target, weight=weight)
+        except nx.NetworkXNoPath:
+            expected = float('inf')
+        actual = index.distance(source, target)
+        if expected == float('inf') or actual == float('inf'):
+            ok = expected == actual
+        else:
+            ok = abs(actual - expected) <= tolerance * max(1.0, expected)
+        if not ok:
+            mismatches.append((source, target, actual, expected))
+    return mismatches
+
+
+def _load_graph(args):
+    import osmnx as ox
+    if args.graphml:
+        return ox.load_graphml(args.graphml)
+    north, south, east, west = args.bbox
+    return ox.project_graph(ox.graph_from_bbox(north, south, east, west, network_type='drive'))
+
+
+if __name__ == '__main__':
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Build or check the contraction hierarchy road index")
+    parser.add_argument('command', choices=['build', 'check'])
+    parser.add_argument('--bbox', nargs=4, type=float, metavar=('NORTH', 'SOUTH', 'EAST', 'WEST'))
+    parser.add_argument('--graphml', help="Load the road graph from a GraphML file instead of downloading it")
+    parser.add_argument('--path', default=CH_INDEX_DIR)
+    parser.add_argument('--samples', type=int, default=100)
+    args = parser.parse_args()
+    if not args.bbox and not args.graphml:
+        parser.error("either --bbox or --graphml is required")
+
+    G = _load_graph(args)
+    if args.command == 'build':
+        save_ch(build_ch(G), args.path)
+        print(f"Saved contraction hierarchy to {args.path}")
+
+    index = load_ch_index(args.path)
+    if index is None:
+        parser.exit(1, f"No contraction hierarchy found at {args.path}\n")
+    mismatches = verify_against_dijkstra(index, G, samples=args.samples)
+    for source, target, actual, expected in mismatches:
+        print(f"Mismatch {source} -> {target}: index {actual}, dijkstra {expected}")
+    print(f"{args.samples - len(mismatches)}/{args.samples} sampled pairs match Dijkstra")
+    if mismatches:
+        parser.exit(1)
@@ -1,32 +1,34 @@
 from data_structures import*
 
+# Every convert_* function accepts any iterable of records, so a streaming
+# parser can feed them one record at a time.
+
+def convert_truck(truck):
+    bin_dimensions = truck['dim']
+    return Truck(
+        truck_id=truck['truckId'],
+        truck_type=truck['name'],
+        bin=Bin(
+            length=bin_dimensions['l'],
+            width=bin_dimensions['b'],
+            height=bin_dimensions['h']
+        ),
+        max_weight=truck.get('maxWeight')  # Optional payload limit
+    )
+
 def convert_trucks(trucks_data):
-    trucks = []
-    for truck in trucks_data:
-        bin_dimensions = truck['dim']
-        truck_instance = Truck(
-            truck_id=truck['truckId'],
-            truck_type=truck['name'],
-            bin=Bin(
-                length=bin_dimensions['l'],
-                width=bin_dimensions['b'],
-                height=bin_dimensions['h']
-            )
-        )
-        trucks.append(truck_instance)
-    return trucks
+    return [convert_truck(truck) for truck in trucks_data]
+
+def convert_order(order):
+    items = [(item['item'], item['qty']) for item in order['items']]
+    return Order(
+        name="Order " + str(order['_id']),  # Assuming order name is derived from ID
+        warehouse_id=order['warehouse'],
+        items=items
+    )
 
 def convert_orders(orders_data):
-    orders = []
-    for order in orders_data:
-        items = [(item['item'], item['qty']) for item in order['items']]
-        order_instance = Order(
-            name="Order " + str(order['_id']),  # Assuming order name is derived from ID
-            warehouse_id=order['warehouse'],
-            items=items
-        )
-        orders.append(order_instance)
-    return orders
+    return [convert_order(order) for order in orders_data]
 def convert_items(items_data):
     items = []
     for item in items_data:
@@ -43,26 +45,54 @@ def convert_items(items_data):
         items.extend(item_instance)
     return items
 
+def item_record(item):
+    """Flatten one catalogue entry into the record ItemBatch.from_records expects."""
+    return {
+        'id': item['itemId'],
+        'length': item['dim']['l'],
+        'width': item['dim']['b'],
+        'height': item['dim']['h'],
+        'weight': item['weight'],
+        'stackable': item['stackable'],
+        'fragile': item['fragile']
+    }
+
+def convert_item_table(items_data):
+    return ItemBatch.from_records(item_record(item) for item in items_data)
+
+def convert_pack_items(items_data, units_seen=None):
+    """
+    Items of a /pack request; repeated ids are numbered as separate units. Pass the
+    same `units_seen` dict to number a second list after the first, and items may
+    carry the "position" they are already loaded at.
+    """
+    items = []
+    units_seen = {} if units_seen is None else units_seen
+    for item in items_data:
+        quantity_id = units_seen[item['id']] = units_seen.get(item['id'], 0) + 1
+        position = tuple(item['position']) if item.get('position') is not None else None
+        items.append(Item(item['id'], quantity_id, item['l'], item['b'], item['h'], item['weight'],
+                          item['stackable'], item['fragile'], position=position))
+    return items
+
+def convert_supplier(supplier):
+    inventory = {inv['itemId']: inv['qty'] for inv in supplier['inventories']}
+    return Supplier(
+        supplier_id=supplier['supplierId'],
+        name=supplier['name'],
+        location=(supplier['lat'], supplier['long']),
+        inventory=inventory
+    )
+
 def convert_suppliers(suppliers_data):
-    suppliers = []
-    for supplier in suppliers_data:
-        inventory = {inv['itemId']: inv['qty'] for inv in supplier['inventories']}
-        supplier_instance = Supplier(
-            supplier_id=supplier['supplierId'],
-            name=supplier['name'],
-            location=(supplier['lat'], supplier['long']),
-            inventory=inventory
-        )
-        suppliers.append(supplier_instance)
-    return suppliers
+    return [convert_supplier(supplier) for supplier in suppliers_data]
+
+def convert_warehouse(warehouse):
+    return Warehouse(
+        warehouse_id=warehouse['warehouseId'],
+        name=warehouse['name'],
+        location=(warehouse['lat'], warehouse['long'])
+    )
 
 def convert_warehouses(warehouses_data):
-    warehouses = []
-    for warehouse in warehouses_data:
-        warehouse_instance = Warehouse(
-            warehouse_id=warehouse['warehouseId'],
-            name=warehouse['name'],
-            location=(warehouse['lat'], warehouse['long'])
-        )
-        warehouses.append(warehouse_instance)
-    return warehouses
+    return [convert_warehouse(warehouse) for warehouse in warehouses_data]
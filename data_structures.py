@@ -17,6 +17,10 @@ def create_items(item_id, length, width, height, weight, stackable, fragile, qua
 
 # Modify the Item class to include a quantity_id attribute
 class Item:
+    # One object per physical unit, so keep them free of a per-instance __dict__
+    __slots__ = ('id', 'quantity_id', 'length', 'width', 'height', 'weight', 'stackable', 'fragile',
+                 'supplier_id', 'warehouse_id', 'quantity', 'position')
+
     def __init__(self, id, quantity_id, length, width, height, weight, stackable, fragile, supplier_id=None, quantity=1, position=None):
         self.id = id
         self.quantity_id = quantity_id  # Unique quantity identifier for items with the same ID
@@ -34,6 +38,98 @@ class Item:
     def _str_(self):
         return f"Item {self.id}-{self.quantity_id}"
     
+# Units available per SKU when the catalogue does not state a quantity
+DEFAULT_UNITS_PER_SKU = 100
+
+class ItemBatch:
+    """
+    SKU table holding dimensions, weight, flags and unit counts in NumPy arrays
+    (one row per SKU). Per-unit Item objects are only created on request, for
+    the quantities that are actually ordered.
+    """
+
+    def __init__(self, ids, lengths, widths, heights, weights, stackable, fragile, counts=None):
+        import numpy as np
+
+        self.ids = list(ids)
+        self.row_of = {item_id: row for row, item_id in enumerate(self.ids)}
+        self.dims = np.column_stack([np.asarray(lengths), np.asarray(widths), np.asarray(heights)]).reshape(-1, 3)
+        self.weights = np.asarray(weights, dtype=np.float64)
+        self.stackable = np.asarray(stackable, dtype=bool)
+        self.fragile = np.asarray(fragile, dtype=bool)
+        if counts is None:
+            counts = [DEFAULT_UNITS_PER_SKU] * len(self.ids)
+        self.counts = np.asarray(counts, dtype=np.int64)
+
+    @classmethod
+    def from_records(cls, records):
+        """
+        Build the table from an iterable of dicts with the Item constructor's
+        field names (id, length, width, height, weight, stackable, fragile) and
+        an optional count.
+        """
+        fields = ('id', 'length', 'width', 'height', 'weight', 'stackable', 'fragile')
+        columns = {name: [] for name in fields}
+        counts = []
+        for record in records:
+            for name in fields:
+                columns[name].append(record[name])
+            counts.append(record.get('count', DEFAULT_UNITS_PER_SKU))
+        return cls(*(columns[name] for name in fields), counts)
+
+    def __len__(self):
+        return len(self.ids)
+
+    def __contains__(self, item_id):
+        return item_id in self.row_of
+
+    @property
+    def volumes(self):
+        return self.dims.prod(axis=1)
+
+    def make_unit(self, row, quantity_id):
+        length, width, height = self.dims[row].tolist()
+        return Item(
+            id=self.ids[row],
+            quantity_id=quantity_id,
+            length=length,
+            width=width,
+            height=height,
+            weight=self.weights[row].item(),
+            stackable=bool(self.stackable[row]),
+            fragile=bool(self.fragile[row]),
+            quantity=1
+        )
+
+    def expand(self, item_id, quantity, start=0):
+        """
+        Create unit objects for one SKU with quantity ids start+1 .. start+quantity,
+        never more than the SKU's unit count.
+        """
+        row = self.row_of[item_id]
+        stop = min(start + quantity, int(self.counts[row]))
+        return [self.make_unit(row, quantity_id) for quantity_id in range(start + 1, stop + 1)]
+
+    def expand_for_orders(self, orders):
+        """
+        Create only the units the orders ask for, SKU by SKU in catalogue order.
+
+        Args:
+            orders (list[Order]): Orders whose (item_id, qty) lines drive the expansion.
+
+        Returns:
+            list[Item]: Units with quantity ids 1..n per SKU.
+        """
+        ordered = {}
+        for order in orders:
+            for item_id, quantity in order.items:
+                ordered[item_id] = ordered.get(item_id, 0) + quantity
+        units = []
+        for item_id in self.ids:
+            if item_id in ordered:
+                units.extend(self.expand(item_id, ordered[item_id]))
+        return units
+
 class Bin:
     def __init__(self, length, width, height):
         self.length = length
@@ -56,16 +152,18 @@ class Warehouse:
         self.demand = {}  # Placeholder for demand
 
 class Truck:
-    def __init__(self, truck_id, truck_type, bin):
+    def __init__(self, truck_id, truck_type, bin, max_weight=None):
         self.truck_id = truck_id
         self.truck_type = truck_type
         self.bin = bin  # Bin instance that contains dimensions and capacity
+        self.max_weight = max_weight  # Payload limit, None when the fleet data does not state one
         self.items = []
 
     def can_carry_items(self, items):
         """
-        Check if the truck can carry the given list of items without exceeding its capacity
-        and dimensions.
+        Check if the truck can carry the given list of items without exceeding its capacity,
+        dimensions and weight limit. Use fleet.FleetCapacity to check many groups against
+        the whole fleet at once.
 
         Args:
             items (list[Item]): A list of items to check.
@@ -77,6 +175,9 @@ class Truck:
         for item in items:
             total_volume += item.length * item.width * item.height
 
+        if self.max_weight is not None and sum(item.weight for item in items) > self.max_weight:
+            return False
+
         if total_volume <= (self.bin.length * self.bin.width * self.bin.height) and all(
             item.length <= self.bin.length and
             item.width <= self.bin.width and
@@ -0,0 +1,88 @@
+import math, time
+import metrics
+
+# Share of the time left when a stage starts that the stage may use. Packing
+# splits its share evenly over the trucks that are still to be packed.
+STAGE_SHARES = {
+    'distances': 0.3,
+    'assignment': 0.6,
+    'packing': 1.0,
+}
+
+# Part of the whole budget held back for serialisation and the response
+RESERVE_SHARE = 0.05
+
+# Solver time limits below this are not worth building a model for; the stage
+# goes straight to its fallback (seconds)
+MIN_SOLVER_SECONDS = 1.0
+
+
+def stopped_without_solution(error):
+    """
+    Whether `error` is GUROBI_CMD failing on a run its time limit stopped before
+    any solution: no result file is written, and assigning the missing values
+    (None) raises a TypeError. Any other error is a real failure.
+    """
+    if not isinstance(error, TypeError):
+        return False
+    tb = error.__traceback__
+    while tb.tb_next is not None:
+        tb = tb.tb_next
+    return tb.tb_frame.f_code.co_name == 'assignVarsVals'
+
+
+def parse_deadline_ms(deadline_ms):
+    """
+    Seconds for a request's deadline_ms, or None when it has none.
+
+    Raises:
+        ValueError: deadline_ms is not a positive number of milliseconds.
+    """
+    if deadline_ms is None:
+        return None
+    try:
+        seconds = float(deadline_ms) / 1000
+    except (TypeError, ValueError):
+        raise ValueError(f"deadline_ms must be a number of milliseconds, got {deadline_ms!r}") from None
+    if not (math.isfinite(seconds) and seconds > 0):
+        raise ValueError(f"deadline_ms must be positive, got {deadline_ms!r}")
+    return seconds
+
+
+class Deadline:
+    """
+    Time budget of one /solve request ("deadline_ms"). Stages ask for their share
+    of what is left and report here when they had to fall back to an incumbent
+    or a heuristic result.
+    """
+
+    def __init__(self, seconds):
+        if seconds <= 0:
+            raise ValueError(f"deadline_ms must be positive, got {seconds * 1000:g}")
+        self.seconds = seconds
+        self.started_at = time.perf_counter()
+        self.expires_at = self.started_at + seconds * (1 - RESERVE_SHARE)
+        self.degraded = []
+
+    @classmethod
+    def from_ms(cls, deadline_ms):
+        """A Deadline for a request's deadline_ms, or None when it has none (see parse_deadline_ms)."""
+        seconds = parse_deadline_ms(deadline_ms)
+        return cls(seconds) if seconds is not None else None
+
+    def remaining(self):
+        return max(0.0, self.expires_at - time.perf_counter())
+
+    def share(self, stage, parts=1):
+        """Seconds `stage` may use now, for one of `parts` equal pieces of work."""
+        return self.remaining() * STAGE_SHARES[stage] / max(parts, 1)
+
+    def degrade(self, stage, fallback, **details):
+        """Record that `stage` returned a `fallback` result ("incumbent", "heuristic", ...)."""
+        entry = {"stage": stage, "fallback": fallback, **details}
+        print(f"Deadline: {stage} fell back to {fallback} {details or ''}")
+        self.degraded.append(entry)
+        metrics.degraded_stages.inc(stage=stage, fallback=fallback)
+
+    def elapsed_ms(self):
+        return round((time.perf_counter() - self.started_at) * 1000, 3)
@@ -0,0 +1,174 @@
+import numpy as np
+import ast, os, shutil, time
+try:
+    import fcntl
+except ImportError:
+    # No flock on Windows; publishes there are not serialised across processes
+    fcntl = None
+
+# Directory holding the published distance matrix snapshots
+SNAPSHOT_DIR = 'distance_snapshot'
+
+# Pointer file naming the snapshot version workers should map
+CURRENT_FILE = 'CURRENT'
+
+# Lock file held while a version is written, so concurrent publishes do not drop each other's entries
+LOCK_FILE = 'publish.lock'
+
+# Older versions kept around so workers still mapping them are not disturbed
+KEEP_VERSIONS = 2
+
+# Workers check the pointer file for a newer snapshot at most this often (seconds)
+REFRESH_INTERVAL = 5.0
+
+
+def parse_cache_key(cache_key):
+    """Split a distance cache key "(lat, lon)_(lat, lon)" back into two location tuples."""
+    first, second = cache_key.split(')_(')
+    return ast.literal_eval(first + ')'), ast.literal_eval('(' + second)
+
+
+def _current_version(path):
+    try:
+        with open(os.path.join(path, CURRENT_FILE)) as f:
+            return f.read().strip()
+    except FileNotFoundError:
+        return None
+
+
+class DistanceSnapshot:
+    """Dense float32 distance matrix plus location index, memory-mapped read-only."""
+
+    def __init__(self, locations, matrix, version=None):
+        self.locations = locations
+        self.matrix = matrix
+        self.version = version
+        self.index = {tuple(loc): i for i, loc in enumerate(locations.tolist())}
+
+    @classmethod
+    def load(cls, path=SNAPSHOT_DIR):
+        version = _current_version(path)
+        if version is None:
+            return None
+        version_dir = os.path.join(path, version)
+        locations = np.load(os.path.join(version_dir, 'locations.npy'))
+        matrix = np.load(os.path.join(version_dir, 'matrix.npy'), mmap_mode='r')
+        return cls(locations, matrix, version)
+
+    def __len__(self):
+        return len(self.locations)
+
+    def lookup(self, loc1, loc2):
+        """Return the snapshot distance between two locations, or None if it is not known."""
+        i = self.index.get(loc1)
+        j = self.index.get(loc2)
+        if i is None or j is None:
+            return None
+        distance = self.matrix[i, j]
+        return None if np.isnan(distance) else float(distance)
+
+    def items(self):
+        """Yield (loc1, loc2, distance) for every known entry."""
+        locations = [tuple(loc) for loc in self.locations.tolist()]
+        rows, cols = np.nonzero(~np.isnan(self.matrix))
+        for i, j in zip(rows.tolist(), cols.tolist()):
+            yield locations[i], locations[j], float(self.matrix[i, j])
+
+
+class SharedDistanceSnapshot:
+    """Holds the current snapshot for this process and swaps it when a newer one is published."""
+
+    def __init__(self, path=SNAPSHOT_DIR):
+        self.path = path
+        self.snapshot = DistanceSnapshot.load(path)
+        self.checked_at = time.time()
+
+    def reload(self):
+        self.snapshot = DistanceSnapshot.load(self.path)
+        self.checked_at = time.time()
+
+    def refresh_if_changed(self):
+        now = time.time()
+        if now - self.checked_at < REFRESH_INTERVAL:
+            return
+        self.checked_at = now
+        version = _current_version(self.path)
+        if version is not None and (self.snapshot is None or version != self.snapshot.version):
+            self.snapshot = DistanceSnapshot.load(self.path)
+
+    def lookup(self, loc1, loc2):
+        self.refresh_if_changed()
+        if self.snapshot is None:
+            return None
+        return self.snapshot.lookup(loc1, loc2)
+
+
+def publish_snapshot(distances, path=SNAPSHOT_DIR):
+    """
+    Write a new snapshot and atomically point workers at it. Entries of the
+    currently published snapshot are kept unless `distances` overrides them.
+    Publishers take an exclusive lock on the snapshot directory, and nothing is
+    written when `distances` holds no new or changed entries.
+
+    Args:
+        distances (dict): Distance cache, {"(lat, lon)_(lat, lon)": meters}.
+
+    Returns:
+        str: The published (or still current) version name.
+    """
+    os.makedirs(path, exist_ok=True)
+    with open(os.path.join(path, LOCK_FILE), 'a') as lock:
+        if fcntl is not None:
+            # Released when the file is closed
+            fcntl.flock(lock, fcntl.LOCK_EX)
+        return _publish(distances, path)
+
+
+def _publish(distances, path):
+    current = DistanceSnapshot.load(path)
+    changes = {}
+    for cache_key, distance in distances.items():
+        loc1, loc2 = parse_cache_key(cache_key)
+        if current is None or current.lookup(loc1, loc2) != float(np.float32(distance)):
+            changes[(loc1, loc2)] = distance
+    if current is not None and not changes:
+        return current.version
+
+    entries = {}
+    if current is not None:
+        entries.update(((loc1, loc2), d) for loc1, loc2, d in current.items())
+    entries.update(changes)
+
+    locations = list(dict.fromkeys(loc for pair in entries for loc in pair))
+    index = {loc: i for i, loc in enumerate(locations)}
+    matrix = np.full((len(locations), len(locations)), np.nan, dtype=np.float32)
+    for (loc1, loc2), distance in entries.items():
+        matrix[index[loc1], index[loc2]] = distance
+
+    version = f"v{time.time_ns()}"
+    version_dir = os.path.join(path, version)
+    os.makedirs(version_dir)
+    np.save(os.path.join(version_dir, 'locations.npy'), np.array(locations, dtype=np.float64).reshape(-1, 2))
+    np.save(os.path.join(version_dir, 'matrix.npy'), matrix)
+
+    # Replacing the pointer file is atomic, so readers see either the old or the new version
+    tmp_pointer = os.path.join(path, CURRENT_FILE + '.tmp')
+    with open(tmp_pointer, 'w') as f:
+        f.write(version)
+    os.replace(tmp_pointer, os.path.join(path, CURRENT_FILE))
+
+    versions = sorted(name for name in os.listdir(path) if name.startswith('v'))
+    for old in versions[:-KEEP_VERSIONS]:
+        shutil.rmtree(os.path.join(path, old), ignore_errors=True)
+
+    print(f"Published distance snapshot {version} with {len(locations)} locations")
+    return version
+
+
+if __name__ == '__main__':
+    import pickle
+    from optimizer import CACHE_FILE
+
+    # Rebuild the snapshot from the pickled distance cache
+    with open(CACHE_FILE, 'rb') as f:
+        publish_snapshot(pickle.load(f))
@@ -0,0 +1,82 @@
+class FleetCapacity:
+    """
+    Per-truck capacities of a fleet as NumPy arrays, computed once and reused
+    for every feasibility query. Trucks without a weight limit get +inf.
+    """
+
+    def __init__(self, trucks):
+        import numpy as np
+
+        self.trucks = list(trucks)
+        self.dims = np.array([(t.bin.length, t.bin.width, t.bin.height) for t in self.trucks],
+                             dtype=np.float64).reshape(-1, 3)
+        self.volumes = self.dims.prod(axis=1)
+        self.max_weights = np.array([np.inf if t.max_weight is None else t.max_weight for t in self.trucks],
+                                    dtype=np.float64)
+
+    def __len__(self):
+        return len(self.trucks)
+
+    def feasibility(self, groups):
+        """
+        Check every load group against every truck.
+
+        Args:
+            groups (list[list[Item]]): Load groups, each to be carried by a single truck.
+
+        Returns:
+            Feasibility: (group x truck) matrices for each check.
+        """
+        return Feasibility(LoadGroups(groups), self)
+
+
+class LoadGroups:
+    """Total volume, total weight and largest item extent per axis of each load group."""
+
+    def __init__(self, groups):
+        import numpy as np
+
+        groups = list(groups)
+        sizes = [len(group) for group in groups]
+        group_of = np.repeat(np.arange(len(groups)), sizes)
+        units = [item for group in groups for item in group]
+        dims = np.array([(i.length, i.width, i.height) for i in units], dtype=np.float64).reshape(-1, 3)
+        weights = np.array([i.weight for i in units], dtype=np.float64)
+
+        self.volumes = np.bincount(group_of, weights=dims.prod(axis=1), minlength=len(groups))
+        self.weights = np.bincount(group_of, weights=weights, minlength=len(groups))
+        self.max_dims = np.zeros((len(groups), 3))
+        np.maximum.at(self.max_dims, group_of, dims)
+
+    def __len__(self):
+        return len(self.volumes)
+
+
+class Feasibility:
+    """
+    Boolean (group x truck) matrices:
+        volume: the group's total volume fits the truck's volume
+        weight: the group's total weight is within the truck's weight limit
+        dims: (group x truck x axis) every item fits the truck along that axis
+        feasible: all of the above
+    """
+
+    def __init__(self, groups, fleet):
+        self.volume = groups.volumes[:, None] <= fleet.volumes[None, :]
+        self.weight = groups.weights[:, None] <= fleet.max_weights[None, :]
+        self.dims = groups.max_dims[:, None, :] <= fleet.dims[None, :, :]
+        self.feasible = self.volume & self.weight & self.dims.all(axis=2)
+
+    def trucks_for(self, group):
+        """Indices of the trucks that can carry the given group."""
+        return self.feasible[group].nonzero()[0].tolist()
+
+    def next_truck(self, group, start=0):
+        """
+        First truck at or after `start` (wrapping around the fleet) that can carry
+        the group, or None if no truck can.
+        """
+        candidates = self.trucks_for(group)
+        if not candidates:
+            return None
+        return next((t for t in candidates if t >= start), candidates[0])
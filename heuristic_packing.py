@@ -0,0 +1,84 @@
+from tracing import span
+
+# Greedy extreme-point packing, used when the packing MILP has no time left. Its
+# placements satisfy the constraints of the optimize_packing model (see
+# packing_templates.PackingTemplate) on the same integer grid, so they are valid
+# solver starts: items stay inside the bin and do not overlap; an item above the
+# floor needs another item whose origin lies inside its footprint exactly its own
+# height lower (the model's `below` rows); and nothing fragile has an item whose
+# base is less than that item's height above its top (the `above` rows). On top
+# of that, nothing is put directly on a non-stackable item. Items already in the
+# bin are kept where they are and packed around.
+
+
+def _overlaps(a, b):
+    """Whether two boxes (x, y, z, l, w, h) share any volume."""
+    return (a[0] < b[0] + b[3] and b[0] < a[0] + a[3] and
+            a[1] < b[1] + b[4] and b[1] < a[1] + a[4] and
+            a[2] < b[2] + b[5] and b[2] < a[2] + a[5])
+
+
+def _footprints_overlap(a, b):
+    return a[0] < b[0] + b[3] and b[0] < a[0] + a[3] and a[1] < b[1] + b[4] and b[1] < a[1] + a[4]
+
+
+def _can_place(box, fragile, bin, placed, flags):
+    x, y, z, l, w, h = box
+    if x + l > bin.length or y + w > bin.width or z + h > bin.height:
+        return False
+    supported = z == 0
+    for other, (other_fragile, other_stackable) in zip(placed, flags):
+        if _overlaps(box, other):
+            return False
+        if not _footprints_overlap(box, other):
+            continue
+        ox, oy, oz, ol, ow, oh = other
+        if other_fragile and oz + oh <= z < oz + oh + h:
+            return False
+        if fragile and z + h <= oz < z + h + oh:
+            return False
+        if not other_stackable and oz + oh == z:
+            return False
+        if z and oz == z - h and x <= ox < x + l and y <= oy < y + w:
+            supported = True
+    return supported
+
+
+def extreme_point_packing(bin, items):
+    """
+    Place `items` into `bin` greedily, largest first, at the lowest free extreme
+    point. Placed items get a position and are appended to bin.items like
+    optimize_packing does; items that do not fit are left out of the bin.
+
+    Returns:
+        int: Number of items placed.
+    """
+    placed = []
+    flags = []
+    for item in bin.items:
+        placed.append((*item.position, item.length, item.width, item.height))
+        flags.append((bool(item.fragile), bool(item.stackable)))
+
+    points = {(0, 0, 0)}
+    for x, y, z, l, w, h in placed:
+        points.update([(x + l, y, z), (x, y + w, z), (x, y, z + h)])
+
+    order = sorted(items, key=lambda item: (item.length * item.width * item.height, item.height), reverse=True)
+    count = 0
+    with span("heuristic_packing", items=len(order)) as heuristic_span:
+        for item in order:
+            # Lowest point first, so the floor fills up row by row before anything is stacked
+            for x, y, z in sorted(points, key=lambda p: (p[2], p[1], p[0])):
+                box = (x, y, z, item.length, item.width, item.height)
+                if not _can_place(box, item.fragile, bin, placed, flags):
+                    continue
+                item.position = (x, y, z)
+                bin.items.append(item)
+                placed.append(box)
+                flags.append((bool(item.fragile), bool(item.stackable)))
+                points.discard((x, y, z))
+                points.update([(x + item.length, y, z), (x, y + item.width, z), (x, y, z + item.height)])
+                count += 1
+                break
+        heuristic_span.attrs["placed"] = count
+    return count
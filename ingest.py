@@ -0,0 +1,222 @@
+import json
+from converter import convert_truck, convert_order, convert_supplier, convert_warehouse, item_record
+from data_structures import ItemBatch
+from result_cache import RecordDigest
+
+# Record converters for the array sections of a /solve payload. Items are kept
+# as flat records and turned into an ItemBatch once the section is complete.
+SECTION_CONVERTERS = {
+    'trucks': convert_truck,
+    'orders': convert_order,
+    'suppliers': convert_supplier,
+    'warehouses': convert_warehouse,
+    'items': item_record,
+}
+
+# Sections a /solve payload must contain at least one record of
+REQUIRED_SECTIONS = ('trucks', 'orders', 'suppliers', 'warehouses', 'items')
+
+NDJSON_TYPES = ('application/x-ndjson', 'application/jsonlines', 'application/jsonl')
+
+# JSON bodies at least this large are parsed incrementally (when ijson is
+# installed). Below it a single orjson decode is faster and the extra copy is small.
+STREAM_MIN_BYTES = 16 * 1024 * 1024
+
+# Bytes read from the request body per call when parsing incrementally
+READ_SIZE = 64 * 1024
+
+
+class PayloadError(ValueError):
+    """A /solve body that is not valid JSON / NDJSON or lacks what a solve needs."""
+    pass
+
+
+def loads(data):
+    """Decode JSON with orjson when it is installed, otherwise with the standard library."""
+    try:
+        import orjson
+    except ImportError:
+        return json.loads(data)
+    return orjson.loads(data)
+
+
+class _BodyReader:
+    """
+    Plain read() view of a request body. werkzeug's LimitedStream treats the
+    zero-byte read ijson uses to probe the stream type as a client disconnect.
+    """
+
+    def __init__(self, stream):
+        self.stream = stream
+
+    def read(self, size=-1):
+        return self.stream.read(size) if size else b''
+
+
+def iter_json_records(stream, content_length=None):
+    """
+    Yield (section, record) for every element of the top-level arrays in a JSON
+    body, and (None, (key, value)) for any other top-level field. Large bodies
+    (or ones of unknown length) are parsed incrementally with ijson, so only one
+    record is held in memory at a time; otherwise the body is decoded in one go.
+    """
+    ijson = None
+    if content_length is None or content_length >= STREAM_MIN_BYTES:
+        try:
+            import ijson
+        except ImportError:
+            pass
+    if ijson is None:
+        body = loads(stream.read())
+        if not isinstance(body, dict):
+            raise PayloadError(f"Payload must be a JSON object, got {type(body).__name__}")
+        for key, value in body.items():
+            if key in SECTION_CONVERTERS and isinstance(value, list):
+                for record in value:
+                    yield key, record
+            else:
+                yield None, (key, value)
+        return
+
+    try:
+        yield from _iter_json_events(ijson, ijson.parse(_BodyReader(stream), use_float=True, buf_size=READ_SIZE))
+    except ijson.JSONError as e:
+        raise PayloadError(f"Invalid JSON: {e}") from e
+
+
+def _iter_json_events(ijson, events):
+    """The incremental half of iter_json_records, over ijson parse events."""
+    for prefix, event, value in events:
+        key, _, rest = prefix.partition('.')
+        if key in SECTION_CONVERTERS:
+            # Only the array elements are records; the array brackets themselves are skipped
+            if rest != 'item':
+                continue
+            section = key
+        elif prefix and not rest and event != 'map_key':
+            section = None
+        else:
+            continue
+        if event not in ('start_map', 'start_array'):
+            yield (section, value) if section else (None, (key, value))
+            continue
+
+        # Build this value from the events up to its closing bracket
+        builder = ijson.ObjectBuilder()
+        builder.event(event, value)
+        depth = 1
+        for _, event, value in events:
+            builder.event(event, value)
+            if event in ('start_map', 'start_array'):
+                depth += 1
+            elif event in ('end_map', 'end_array'):
+                depth -= 1
+                if not depth:
+                    break
+        yield (section, builder.value) if section else (None, (key, builder.value))
+
+
+def iter_ndjson_records(stream):
+    """
+    Yield (section, record) for an NDJSON body. Each line is one record whose
+    "section" field names the array it belongs to; lines without it carry
+    top-level fields such as requestId or timings.
+    """
+    for line in stream:
+        line = line.strip()
+        if not line:
+            continue
+        record = loads(line)
+        if not isinstance(record, dict):
+            raise PayloadError(f"Each NDJSON line must be a JSON object, got {type(record).__name__}")
+        section = record.pop('section', None)
+        if section is None:
+            for key, value in record.items():
+                yield None, (key, value)
+        elif section in SECTION_CONVERTERS:
+            yield section, record
+        else:
+            raise PayloadError(f"Unknown NDJSON section {section!r}")
+
+
+class SolvePayload:
+    """Converted /solve input, built record by record while the body is parsed."""
+
+    def __init__(self):
+        self.trucks = []
+        self.orders = []
+        self.suppliers = []
+        self.warehouses = []
+        self.item_records = []
+        self.options = {}
+        self.records = 0
+        self.counts = {}
+        self.digest = RecordDigest()
+        self._catalogue = None
+
+    def add(self, section, record):
+        try:
+            converted = SECTION_CONVERTERS[section](record)
+        except KeyError as e:
+            raise PayloadError(f"A {section} record is missing the field {e}") from e
+        except TypeError as e:
+            raise PayloadError(f"Invalid {section} record: {e}") from e
+        getattr(self, 'item_records' if section == 'items' else section).append(converted)
+        self.digest.add(section, record)
+        self.records += 1
+        self.counts[section] = self.counts.get(section, 0) + 1
+
+    def cache_key(self):
+        """Key for result_cache: the same for any ordering of the same records and options."""
+        return self.digest.key(self.options)
+
+    @property
+    def catalogue(self):
+        if self._catalogue is None:
+            self._catalogue = ItemBatch.from_records(self.item_records)
+            self.item_records = []
+        return self._catalogue
+
+    def get(self, key, default=None):
+        return self.options.get(key, default)
+
+
+def read_solve_payload(stream, content_type=None, content_length=None):
+    """
+    Parse a /solve body from a file-like stream straight into model objects.
+
+    Args:
+        stream: Binary stream of the request body.
+        content_type (str, optional): NDJSON media types select line-by-line parsing,
+            anything else is read as a single JSON object.
+        content_length (int, optional): Body size, used to pick the JSON parsing strategy.
+
+    Returns:
+        SolvePayload: Converted sections plus the remaining top-level fields in `options`.
+
+    Raises:
+        PayloadError: The body cannot be parsed, has a malformed record, or lacks
+            one of REQUIRED_SECTIONS.
+    """
+    media_type = (content_type or '').split(';')[0].strip().lower()
+    records = (iter_ndjson_records(stream) if media_type in NDJSON_TYPES
+               else iter_json_records(stream, content_length))
+
+    payload = SolvePayload()
+    try:
+        for section, record in records:
+            if section is None:
+                key, value = record
+                payload.options[key] = value
+            else:
+                payload.add(section, record)
+    except PayloadError:
+        raise
+    except ValueError as e:
+        # orjson and json decode errors are ValueErrors
+        raise PayloadError(f"Invalid JSON: {e}") from e
+
+    missing = [section for section in REQUIRED_SECTIONS if not payload.counts.get(section)]
+    if missing:
+        raise PayloadError(f"Payload is missing required sections: {', '.join(missing)}")
+    return payload
@@ -0,0 +1,226 @@
+import json, os, re, time
+from data_structures import Bin, Supplier, Warehouse, Truck, Order, ItemBatch
+
+# Directory the /solve handler writes captured instances to
+INSTANCE_DIR = 'instances'
+
+# Bumped whenever the array layout changes
+FORMAT_VERSION = 1
+
+# Problem instances are stored as a single uncompressed .npz: identifiers and
+# names go into a small JSON header, everything that grows with the instance
+# (order lines, inventories, the SKU table, distances, placements) into flat
+# arrays indexed by position in the id lists. IDs are interned, so order lines
+# and inventories only hold integer indexes. Nothing needs pickle to load.
+
+
+def _csr(rows):
+    """Offsets array for a list of row lengths."""
+    import numpy as np
+
+    offsets = np.zeros(len(rows) + 1, dtype=np.int64)
+    np.cumsum(rows, out=offsets[1:])
+    return offsets
+
+
+def save_instance(path, suppliers, warehouses, trucks, catalogue, orders, distances=None, assignments=None):
+    """
+    Write a full /solve problem instance to `path` (.npz).
+
+    Args:
+        catalogue (ItemBatch): SKU table.
+        distances (dict, optional): {(supplier_id, warehouse_id): meters}, as returned by
+            build_distance_matrix. Replays use it instead of the road network.
+        assignments (list, optional): optimize_routes result. When given, the truck
+            loads currently in each truck's bin are stored too.
+
+    Returns:
+        str: The path written.
+    """
+    import numpy as np
+
+    # Catalogue SKUs come first, so row i of the SKU table is sku_ids[i]
+    sku_ids = list(catalogue.ids)
+    sku_index = {sku: i for i, sku in enumerate(sku_ids)}
+
+    def sku(item_id):
+        if item_id not in sku_index:
+            sku_index[item_id] = len(sku_ids)
+            sku_ids.append(item_id)
+        return sku_index[item_id]
+
+    supplier_index = {s.supplier_id: i for i, s in enumerate(suppliers)}
+    warehouse_index = {w.warehouse_id: i for i, w in enumerate(warehouses)}
+
+    # Orders may name warehouses that are not in the warehouse list
+    order_warehouse_ids = [w.warehouse_id for w in warehouses]
+    order_warehouse_index = dict(warehouse_index)
+
+    def order_warehouse(warehouse_id):
+        if warehouse_id not in order_warehouse_index:
+            order_warehouse_index[warehouse_id] = len(order_warehouse_ids)
+            order_warehouse_ids.append(warehouse_id)
+        return order_warehouse_index[warehouse_id]
+
+    arrays = {
+        'supplier_locations': np.array([s.location for s in suppliers], dtype=np.float64).reshape(-1, 2),
+        'inventory_offsets': _csr([len(s.inventory) for s in suppliers]),
+        'inventory_sku': np.array([sku(i) for s in suppliers for i in s.inventory], dtype=np.int64),
+        'inventory_qty': np.array([q for s in suppliers for q in s.inventory.values()], dtype=np.int64),
+        'warehouse_locations': np.array([w.location for w in warehouses], dtype=np.float64).reshape(-1, 2),
+        'truck_dims': np.array([(t.bin.length, t.bin.width, t.bin.height) for t in trucks]).reshape(-1, 3),
+        'truck_max_weights': np.array([np.nan if t.max_weight is None else t.max_weight for t in trucks],
+                                      dtype=np.float64),
+        'sku_dims': np.asarray(catalogue.dims),
+        'sku_weights': np.asarray(catalogue.weights),
+        'sku_stackable': np.asarray(catalogue.stackable),
+        'sku_fragile': np.asarray(catalogue.fragile),
+        'sku_counts': np.asarray(catalogue.counts),
+        'order_names': np.array([o.name for o in orders], dtype=np.str_),
+        'order_warehouse': np.array([order_warehouse(o.warehouse_id) for o in orders], dtype=np.int64),
+        'order_offsets': _csr([len(o.items) for o in orders]),
+        'line_sku': np.array([sku(i) for o in orders for i, _ in o.items], dtype=np.int64),
+        'line_qty': np.array([q for o in orders for _, q in o.items], dtype=np.int64),
+    }
+    if distances is not None:
+        matrix = np.full((len(suppliers), len(warehouses)), np.nan)
+        for (s_id, w_id), distance in distances.items():
+            matrix[supplier_index[s_id], warehouse_index[w_id]] = distance
+        arrays['distances'] = matrix
+
+    if assignments is not None:
+        arrays['assignments'] = np.array(
+            [(supplier_index[s_id], warehouse_index[w_id], sku(i_id), q_id, qty)
+             for s_id, w_id, i_id, q_id, qty in assignments], dtype=np.float64).reshape(-1, 5)
+        # (truck, sku, quantity_id, supplier, warehouse, x, y, z) per loaded unit
+        arrays['loads'] = np.array(
+            [(t, sku(item.id), item.quantity_id, supplier_index.get(item.supplier_id, -1),
+              order_warehouse(item.warehouse_id), *item.position)
+             for t, truck in enumerate(trucks) for item in truck.bin.items], dtype=np.int64).reshape(-1, 8)
+
+    header = {
+        'version': FORMAT_VERSION,
+        'created': time.time(),
+        'sku_ids': sku_ids,
+        'catalogue_size': len(catalogue),
+        'supplier_ids': [s.supplier_id for s in suppliers],
+        'supplier_names': [s.name for s in suppliers],
+        'warehouse_ids': [w.warehouse_id for w in warehouses],
+        'warehouse_names': [w.name for w in warehouses],
+        'order_warehouse_ids': order_warehouse_ids,
+        'truck_ids': [t.truck_id for t in trucks],
+        'truck_types': [t.truck_type for t in trucks],
+    }
+    arrays['header'] = np.array(json.dumps(header))
+
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    # Written under a temporary name so a crash never leaves a truncated snapshot behind
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'wb') as f:
+        np.savez(f, **arrays)
+    os.replace(tmp_path, path)
+    return path
+
+
+class ProblemInstance:
+    """A problem instance read back by load_instance, ready to pass to optimize_routes."""
+
+    def __init__(self, suppliers, warehouses, trucks, catalogue, orders, distances=None,
+                 assignments=None, loads=None, created=None):
+        self.suppliers = suppliers
+        self.warehouses = warehouses
+        self.trucks = trucks
+        self.catalogue = catalogue
+        self.orders = orders
+        self.distances = distances
+        self.assignments = assignments
+        self.loads = loads  # {truck_id: [(item_id, quantity_id, supplier_id, warehouse_id, position)]}
+        self.created = created
+
+
+def load_instance(path):
+    """
+    Read a snapshot written by save_instance.
+
+    Returns:
+        ProblemInstance: Fresh model objects; trucks start empty, the stored solution
+            (if any) is in `assignments` and `loads`.
+    """
+    import numpy as np
+
+    with np.load(path, allow_pickle=False) as data:
+        header = json.loads(data['header'].item())
+        if header['version'] != FORMAT_VERSION:
+            raise ValueError(f"{path} uses snapshot format {header['version']}, expected {FORMAT_VERSION}")
+        sku_ids = header['sku_ids']
+        supplier_ids = header['supplier_ids']
+        warehouse_ids = header['warehouse_ids']
+
+        inventory_offsets = data['inventory_offsets'].tolist()
+        inventory_sku = data['inventory_sku'].tolist()
+        inventory_qty = data['inventory_qty'].tolist()
+        suppliers = [
+            Supplier(supplier_id, name, tuple(location), {
+                sku_ids[inventory_sku[k]]: inventory_qty[k]
+                for k in range(inventory_offsets[i], inventory_offsets[i + 1])
+            })
+            for i, (supplier_id, name, location) in enumerate(
+                zip(supplier_ids, header['supplier_names'], data['supplier_locations'].tolist()))
+        ]
+        warehouses = [
+            Warehouse(warehouse_id, name, tuple(location))
+            for warehouse_id, name, location in zip(warehouse_ids, header['warehouse_names'],
+                                                    data['warehouse_locations'].tolist())
+        ]
+        trucks = [
+            Truck(truck_id, truck_type, Bin(*dims), None if np.isnan(max_weight) else max_weight)
+            for truck_id, truck_type, dims, max_weight in zip(header['truck_ids'], header['truck_types'],
+                                                              data['truck_dims'].tolist(),
+                                                              data['truck_max_weights'].tolist())
+        ]
+
+        size = header['catalogue_size']
+        catalogue = ItemBatch(sku_ids[:size], *data['sku_dims'].T, data['sku_weights'],
+                              data['sku_stackable'], data['sku_fragile'], data['sku_counts'])
+
+        order_offsets = data['order_offsets'].tolist()
+        line_sku = data['line_sku'].tolist()
+        line_qty = data['line_qty'].tolist()
+        order_warehouse_ids = header['order_warehouse_ids']
+        orders = [
+            Order(name, order_warehouse_ids[w],
+                  [(sku_ids[line_sku[k]], line_qty[k]) for k in range(order_offsets[i], order_offsets[i + 1])])
+            for i, (name, w) in enumerate(zip(data['order_names'].tolist(), data['order_warehouse'].tolist()))
+        ]
+
+        distances = None
+        if 'distances' in data:
+            matrix = data['distances']
+            distances = {
+                (supplier_ids[i], warehouse_ids[j]): float(matrix[i, j])
+                for i, j in zip(*np.nonzero(~np.isnan(matrix)))
+            }
+
+        assignments = loads = None
+        if 'assignments' in data:
+            assignments = [
+                (supplier_ids[int(s)], warehouse_ids[int(w)], sku_ids[int(i)], int(q), qty)
+                for s, w, i, q, qty in data['assignments'].tolist()
+            ]
+            loads = {truck.truck_id: [] for truck in trucks}
+            for t, i, q, s, w, x, y, z in data['loads'].tolist():
+                loads[trucks[int(t)].truck_id].append(
+                    (sku_ids[int(i)], int(q), supplier_ids[int(s)] if s >= 0 else None,
+                     order_warehouse_ids[int(w)], (x, y, z)))
+
+    return ProblemInstance(suppliers, warehouses, trucks, catalogue, orders, distances,
+                           assignments, loads, header['created'])
+
+
+def capture_path(request_id, directory=INSTANCE_DIR):
+    """Snapshot file name for a /solve request. Request ids come from clients, so
+    anything but letters, digits, '-' and '_' is replaced."""
+    safe_id = re.sub(r'[^A-Za-z0-9_-]', '_', str(request_id))
+    return os.path.join(directory, f"{safe_id}.npz")
@@ -1,7 +1,24 @@
-from pulp import LpProblem, LpMaximize, LpVariable, lpSum, GUROBI_CMD, value
+import logging
+from tracing import span, model_size
+from model_estimate import estimate_packing, choose_engine, solve_times, WARM_START, HEURISTIC
+from heuristic_packing import extreme_point_packing
+from packing_templates import get_template
+from data_structures import Bin
+from deadline import stopped_without_solution
+import metrics
 
-def optimize_packing(bin, items):
-    print("INSIDE OPTIMIZE_PACKING")
+# Solver time limit of the region re-optimisation in insert_items (seconds)
+INSERT_REGION_TIME_LIMIT = 5
+
+# Engine reported when the heuristic-first pass of pack_items placed everything
+HEURISTIC_FIRST = 'heuristic_first'
+
+# Per-item placement details, off unless this logger is set to DEBUG
+logger = logging.getLogger('optisupply.packing')
+
+def optimize_packing(bin, items, time_limit=None, warm_start=None, solver_options=None, formulation=None):
+    # PuLP is imported here so that importing the service does not pay for it
+    from pulp import LpProblem, LpMaximize, GUROBI_CMD, LpStatus, value
 
     # Create a hash map to store the mapping of unique IDs to items
     item_hash_map = {}
@@ -13,106 +30,190 @@ def optimize_packing(bin, items):
         item_hash_map[unique_id] = item
         unique_items.append((unique_id, item))
 
-    print("ITEMS TO LOAD: ", [(uid, _) for uid, _ in unique_items])
-
-    # Initialize the optimization problem
-    prob = LpProblem("3D_Bin_Packing", LpMaximize)
-
-    # Define decision variables for item placement using unique IDs
-    x = LpVariable.dicts("item_placement", 
-                         [(uid, dx, dy, dz) for uid, item in unique_items 
-                          for dx in range(bin.length - item.length + 1)
-                          for dy in range(bin.width - item.width + 1)
-                          for dz in range(bin.height - item.height + 1)], 
-                         cat='Binary')
-
-    # Objective: Maximize space utilization
-    prob += lpSum(x[(uid, dx, dy, dz)] * (1 + 0.01 * dx / bin.length) for uid, item in unique_items 
-                  for dx in range(bin.length - item.length + 1)
-                  for dy in range(bin.width - item.width + 1)
-                  for dz in range(bin.height - item.height + 1))
-
-    # Each item can only be placed in one position
-    for uid, item in unique_items:
-        prob += lpSum(x[(uid, dx, dy, dz)] for dx in range(bin.length - item.length + 1)
-                      for dy in range(bin.width - item.width + 1)
-                      for dz in range(bin.height - item.height + 1)) <= 1
-
-    # Ensure items do not overlap in the bin
-    for px in range(bin.length):
-        for py in range(bin.width):
-            for pz in range(bin.height):
-                prob += lpSum(x[(uid, dx, dy, dz)] 
-                              for uid, item in unique_items
-                              for dx in range(max(0, px - item.length + 1), min(px + 1, bin.length - item.length + 1))
-                              for dy in range(max(0, py - item.width + 1), min(py + 1, bin.width - item.width + 1))
-                              for dz in range(max(0, pz - item.height + 1), min(pz + 1, bin.height - item.height + 1))
-                              if dx + item.length > px and dy + item.width > py and dz + item.height > pz) <= 1
-
-    # Support constraint for all items: Ensure no item is floating in the air
-    for uid, item in unique_items:
-        for dx in range(bin.length - item.length + 1):
-            for dy in range(bin.width - item.width + 1):
-                for dz in range(1, bin.height - item.height + 1):  # Start from height 1 to ensure items are supported
-                    prob += x[(uid, dx, dy, dz)] <= lpSum(x[(j_uid, dx1, dy1, dz - item.height)] 
-                                                           for j_uid, j_item in unique_items if j_uid != uid
-                                                           for dx1 in range(dx, min(dx + item.length, bin.length - j_item.length + 1))
-                                                           for dy1 in range(dy, min(dy + item.width, bin.width - j_item.width + 1))
-                                                           if (j_uid, dx1, dy1, dz - item.height) in x)
-
-    # Fragile items must be placed on the floor or fully supported
-    for uid, item in unique_items:
-        if item.fragile:
-            for dx in range(bin.length - item.length + 1):
-                for dy in range(bin.width - item.width + 1):
-                    for dz in range(1, bin.height - item.height + 1):
-                        prob += x[(uid, dx, dy, dz)] <= lpSum(x[(j_uid, dx1, dy1, dz - item.height)] 
-                                                               for j_uid, j_item in unique_items if j_uid != uid
-                                                               for dx1 in range(dx, min(dx + item.length, bin.length - j_item.length + 1))
-                                                               for dy1 in range(dy, min(dy + item.width, bin.width - j_item.width + 1))
-                                                               if (j_uid, dx1, dy1, dz - item.height) in x)
-
-    # Fragile items cannot have items placed on top of them
-    for uid, item in unique_items:
-        if item.fragile:
+    logger.debug("Items to load: %s", unique_items)
+
+    with span("model_build") as build_span:
+        # Initialize the optimization problem
+        prob = LpProblem("3D_Bin_Packing", LpMaximize)
+
+        # Positions and the constraint structure come from the template of this bin size
+        # and these box sizes (built once, then cached); only the items are added per call
+        template = get_template(bin, items)
+        x = template.build(prob, unique_items, formulation)
+        build_span.attrs["template_types"] = len(template.types)
+
+        # Placements of a heuristic solution ({unique id: (x, y, z)}) as the solver's start
+        for uid, position in (warm_start or {}).items():
+            if (uid, *position) in x:
+                x[(uid, *position)].setInitialValue(1)
+
+        size = model_size(prob)
+        build_span.attrs.update(size)
+        metrics.observe_model("packing", size)
+
+    with span("solver") as solver_span:
+        # Callers may bound the solver time (seconds); the best placement found so far is used
+        try:
+            prob.solve(GUROBI_CMD(msg=1, timeLimit=time_limit, warmStart=bool(warm_start),
+                                  options=solver_options or []))
+        except TypeError as e:
+            # A missing or failing gurobi_cl raises PulpSolverError, which always propagates
+            if time_limit is None or not stopped_without_solution(e):
+                raise
+        solver_span.attrs["status"] = LpStatus[prob.status]
+    if prob.status == 1 and (time_limit is None or solver_span.wall < time_limit):
+        solve_times.observe("packing", size["nonzeros"], solver_span.wall)
+    metrics.solver_status.inc(model="packing", status=LpStatus[prob.status])
+    metrics.solver_seconds.observe(solver_span.wall, model="packing")
+
+    with span("extraction", items=len(unique_items)) as extraction_span:
+        # Extract and assign positions
+        assigned_positions = set()  # Keep track of assigned positions to ensure no duplicates
+        for uid, item in unique_items:
+            placed = False
             for dx in range(bin.length - item.length + 1):
                 for dy in range(bin.width - item.width + 1):
-                    for dz in range(bin.height - item.height):
-                        prob += lpSum(x[(j_uid, dx1, dy1, dz1)] 
-                                      for j_uid, j_item in unique_items if j_uid != uid
-                                      for dx1 in range(max(0, dx - j_item.length + 1), min(dx + item.length, bin.length - j_item.length + 1))
-                                      for dy1 in range(max(0, dy - j_item.width + 1), min(dy + item.width, bin.width - j_item.width + 1))
-                                      for dz1 in range(dz + item.height, min(dz + item.height + j_item.height, bin.height))
-                                      if (j_uid, dx1, dy1, dz1) in x and dx1 + j_item.length > dx and dy1 + j_item.width > dy) <= (1 - x[(uid, dx, dy, dz)]) * 1000
-
-    # Set a time limit for the solver to improve performance
-    prob.solve(GUROBI_CMD(msg=1))  # Adjust timeLimit as needed
-
-    # Extract and assign positions
-    assigned_positions = set()  # Keep track of assigned positions to ensure no duplicates
-    for uid, item in unique_items:
-        print(f"Checking placement for item {uid}")
-        placed = False
-        for dx in range(bin.length - item.length + 1):
-            for dy in range(bin.width - item.width + 1):
-                for dz in range(bin.height - item.height + 1):
-                    if value(x[(uid, dx, dy, dz)]) == 1:
-                        print("1...")
-                        print(item.id)
-                        if (dx, dy, dz) not in assigned_positions:
-                            print("2...")
-                            print(item.id)
-                            item.position = (dx, dy, dz)
-                            bin.items.append(item)
-                            assigned_positions.add((dx, dy, dz))
-                            placed = True
-                            print(f"Item {uid} placed at position {item.position}")
-                            break  # Exit after placing the item to prevent multiple placements
-                        else:
-                            print(f"Position {dx, dy, dz} is already occupied!")
+                    for dz in range(bin.height - item.height + 1):
+                        if value(x[(uid, dx, dy, dz)]) == 1:
+                            if (dx, dy, dz) not in assigned_positions:
+                                item.position = (dx, dy, dz)
+                                bin.items.append(item)
+                                assigned_positions.add((dx, dy, dz))
+                                placed = True
+                                logger.debug("Item %s placed at position %s", uid, item.position)
+                                break  # Exit after placing the item to prevent multiple placements
+                            else:
+                                logger.debug("Position %s is already occupied", (dx, dy, dz))
+                    if placed:
+                        break
                 if placed:
                     break
-            if placed:
-                break
+        extraction_span.attrs["placed"] = len(assigned_positions)
+
+    bin_volume = bin.length * bin.width * bin.height
+    placed_volume = sum(item.length * item.width * item.height for item in bin.items)
+    metrics.packing_volume_utilisation.observe(placed_volume / bin_volume if bin_volume else 0.0)
+    metrics.packing_placed_ratio.observe(len(assigned_positions) / len(unique_items) if unique_items else 1.0)
+
+    return prob.status
+
+def heuristic_start(bin, items):
+    """Extreme-point placement of `items` as a warm start ({unique id: position}), leaving `bin` and the items as they were."""
+    positions = [item.position for item in items]
+    scratch = Bin(bin.length, bin.width, bin.height)
+    extreme_point_packing(scratch, items)
+    warm_start = {f"{item.id}_{item.quantity_id}": item.position for item in scratch.items}
+    for item, position in zip(items, positions):
+        item.position = position
+    return warm_start
+
+
+def pack_items(bin, items, time_limit=None, portfolio=False, blocks=False, heuristic_first=False):
+    """
+    Pack `items` into `bin` with the engine model_estimate.choose_engine picks for
+    the model size: the MILP, the MILP started from the extreme-point heuristic's
+    placement, or the heuristic alone. With `portfolio` the MILP engines are raced
+    against each other instead (see portfolio.race_packing). With `blocks`
+    identical units are packed as blocks (see block_building), and the units of
+    blocks that did not fit are then placed one by one by the heuristic.
+
+    With `heuristic_first` the extreme-point heuristic runs before anything
+    else. When it places every item in a layout the model admits
+    (PackingTemplate.admits), the MILP is skipped, since it could only improve
+    the tie-breaker; otherwise its placement is the MILP's start, if the model
+    admits it.
+
+    Returns:
+        tuple: (engine, LpStatus code, or None for the heuristic engine)
+    """
+    if blocks:
+        from block_building import build_blocks, expand_blocks
+
+        result = pack_items(bin, build_blocks(bin, items), time_limit, portfolio, heuristic_first=heuristic_first)
+        expand_blocks(bin)
+        in_bin = {id(item) for item in bin.items}
+        unplaced = [item for item in items if id(item) not in in_bin]
+        if unplaced:
+            extreme_point_packing(bin, unplaced)
+        return result
+
+    with span("model_estimate") as estimate_span:
+        estimate = estimate_packing(bin, items)
+        engine, predicted = choose_engine("packing", estimate, time_limit)
+        estimate_span.attrs.update(estimate, engine=engine, predicted_seconds=predicted)
+    logger.debug("Packing %d items with the %s engine (%d nonzeros)", len(items), engine, estimate['nonzeros'])
+
+    first = None
+    if heuristic_first:
+        loaded = list(bin.items)
+        positions = [item.position for item in items]
+        placed = extreme_point_packing(bin, items)
+        # The heuristic engine keeps this placement anyway; only build the template for a model we would solve
+        admitted = engine == HEURISTIC or get_template(bin, items).admits(bin.items[len(loaded):])
+        if placed == len(items) and admitted:
+            metrics.heuristic_first.inc(result="complete")
+            logger.debug("Packed all %d items with the heuristic, skipping the solver", len(items))
+            return HEURISTIC_FIRST, None
+        if admitted:
+            first = {f"{item.id}_{item.quantity_id}": item.position for item in bin.items[len(loaded):]}
+        bin.items = loaded
+        for item, position in zip(items, positions):
+            item.position = position
+        metrics.heuristic_first.inc(result="incumbent" if first is not None else "rejected")
+
+    if engine == HEURISTIC:
+        extreme_point_packing(bin, items)
+        return engine, None
+    if portfolio:
+        from portfolio import race_packing
+        return race_packing(bin, items, time_limit)
+    if first is not None:
+        return engine, optimize_packing(bin, items, time_limit=time_limit, warm_start=first)
+    warm_start = heuristic_start(bin, items) if engine == WARM_START else None
+    return engine, optimize_packing(bin, items, time_limit=time_limit, warm_start=warm_start)
+
+
+def _free_slab(length, loaded):
+    """The larger empty slab (start, end) along the bin length, in front of or behind the `loaded` items."""
+    if not loaded:
+        return 0, length
+    front = min(item.position[0] for item in loaded)
+    back = max(item.position[0] + item.length for item in loaded)
+    return (0, front) if front >= length - back else (back, length)
+
+
+def insert_items(bin, items, time_limit=INSERT_REGION_TIME_LIMIT):
+    """
+    Add `items` to an already packed `bin`, leaving the items in it where they
+    are. The extreme-point heuristic fills the free space around them first;
+    only when it cannot place everything is the empty slab at one end of the bin
+    re-optimised with the MILP (started from the heuristic's placement there),
+    and that result is kept if it places more of the new items.
 
-    return prob.status
\ No newline at end of file
+    Returns:
+        tuple: (method, number of items placed); method is "extreme_point" or "region"
+    """
+    loaded = list(bin.items)
+    with span("insertion", loaded=len(loaded), items=len(items)) as insert_span:
+        placed = extreme_point_packing(bin, items)
+        method = "extreme_point"
+        start, end = _free_slab(bin.length, loaded)
+        if placed < len(items) and end > start:
+            positions = [item.position for item in items]
+            region = Bin(end - start, bin.width, bin.height)
+            estimate = estimate_packing(region, items)
+            engine, _ = choose_engine("packing", estimate, time_limit)
+            if engine != HEURISTIC:
+                optimize_packing(region, items, time_limit=time_limit, warm_start=heuristic_start(region, items))
+            if len(region.items) > placed:
+                for item in region.items:
+                    x, y, z = item.position
+                    item.position = (x + start, y, z)
+                bin.items = loaded + region.items
+                method, placed = "region", len(region.items)
+            else:
+                for item, position in zip(items, positions):
+                    item.position = position
+        insert_span.attrs.update(method=method, placed=placed)
+    metrics.packing_insertions.inc(method=method)
+    return method, placed
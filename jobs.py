@@ -0,0 +1,234 @@
+import os, threading, time, uuid
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+import metrics
+
+# Solves running at the same time; each may still fan out distance workers
+JOB_WORKERS = max(1, (os.cpu_count() or 2) // 2)
+
+# Queued plus running jobs accepted before POST /jobs answers 429
+MAX_PENDING_JOBS = 64
+
+# Finished jobs (and their results) are kept this long for GET /jobs/<id> (seconds)
+JOB_RETENTION = 3600
+
+# How often a running job republishes its distance progress (seconds)
+PROGRESS_INTERVAL = 1.0
+
+QUEUED, RUNNING, SUCCEEDED, FAILED, CANCELLED = 'queued', 'running', 'succeeded', 'failed', 'cancelled'
+
+
+class JobCancelled(Exception):
+    pass
+
+
+class QueueFull(Exception):
+    pass
+
+
+def _run_job(job_id, body, content_type, capture, progress, cancel_requests):
+    """
+    Worker process entry point: parse and solve one /solve body. Stage and distance
+    progress go to the shared `progress` dict; a flag in `cancel_requests` stops the
+    job at the next span boundary.
+    """
+    import io
+    from ingest import read_solve_payload
+    from optimizer import distance_progress
+    from pipeline import solve_payload
+    from tracing import span
+
+    state = {'startedAt': time.time(), 'stage': 'ingestion'}
+    lock = threading.Lock()
+    finished = threading.Event()
+
+    def publish(**changes):
+        with lock:
+            state.update(changes)
+            progress[job_id] = dict(state)
+
+    def listener(name):
+        if cancel_requests.get(job_id) and not state.get('cancelled'):
+            state['cancelled'] = True
+            raise JobCancelled(f"Job {job_id} was cancelled during {state['stage']}")
+        publish(stage=name)
+
+    def report_distances():
+        while not finished.wait(PROGRESS_INTERVAL):
+            distances = distance_progress.get(job_id)
+            if distances is not None:
+                publish(distances=distances.as_dict())
+
+    publish()
+    reporter = threading.Thread(target=report_distances, daemon=True)
+    reporter.start()
+    try:
+        with span("ingestion") as ingestion_span:
+            payload = read_solve_payload(io.BytesIO(body), content_type, len(body))
+            ingestion_span.attrs["records"] = payload.records
+        return solve_payload(payload, job_id, capture=capture, ingestion_span=ingestion_span, listener=listener)
+    finally:
+        finished.set()
+
+
+class Job:
+    def __init__(self, job_id):
+        self.job_id = job_id
+        self.state = QUEUED
+        self.submitted_at = time.time()
+        self.finished_at = None
+        self.result = None
+        self.error = None
+        self.future = None
+        self.cancel_requested = False
+
+    @property
+    def done(self):
+        return self.state in (SUCCEEDED, FAILED, CANCELLED)
+
+
+class JobQueue:
+    """
+    Runs /solve bodies in a bounded pool of worker processes. Jobs wait in
+    submission order until a worker is free; the pool and the shared progress
+    dicts are only started with the first job.
+    """
+
+    def __init__(self, workers=JOB_WORKERS, max_pending=MAX_PENDING_JOBS):
+        self.workers = workers
+        self.max_pending = max_pending
+        self.jobs = OrderedDict()
+        self.lock = threading.Lock()
+        self._executor = None
+        self._manager = None
+        self.progress = None
+        self.cancel_requests = None
+
+    def _start(self):
+        import multiprocessing
+
+        # Fresh interpreters instead of forks of a multi-threaded web worker
+        context = multiprocessing.get_context('spawn')
+        if self._manager is None:
+            self._manager = context.Manager()
+            self.progress = self._manager.dict()
+            self.cancel_requests = self._manager.dict()
+        if self._executor is not None:
+            # A broken pool being replaced; release its queues and management thread
+            self._executor.shutdown(wait=False, cancel_futures=True)
+        self._executor = ProcessPoolExecutor(self.workers, mp_context=context)
+
+    def _prune(self):
+        cutoff = time.time() - JOB_RETENTION
+        for job_id in [job_id for job_id, job in self.jobs.items() if job.done and job.finished_at < cutoff]:
+            del self.jobs[job_id]
+
+    def pending(self):
+        return sum(1 for job in self.jobs.values() if not job.done)
+
+    def submit(self, body, content_type=None, capture=False):
+        """
+        Queue a /solve body (JSON or NDJSON bytes).
+
+        Returns:
+            Job: The queued job.
+
+        Raises:
+            QueueFull: MAX_PENDING_JOBS jobs are already queued or running.
+        """
+        with self.lock:
+            self._prune()
+            if self.pending() >= self.max_pending:
+                raise QueueFull(f"{self.max_pending} jobs are already queued or running, retry later")
+            if self._executor is None:
+                self._start()
+
+            job = Job(uuid.uuid4().hex)
+            args = (_run_job, job.job_id, body, content_type, capture, self.progress, self.cancel_requests)
+            try:
+                job.future = self._executor.submit(*args)
+            except BrokenProcessPool:
+                # A worker died (e.g. out of memory); replace the pool and retry once
+                self._start()
+                job.future = self._executor.submit(*args)
+            self.jobs[job.job_id] = job
+            metrics.jobs_pending.inc()
+
+        job.future.add_done_callback(lambda future: self._finish(job, future))
+        return job
+
+    def _finish(self, job, future):
+        if future.cancelled():
+            job.state = CANCELLED
+        elif isinstance(future.exception(), JobCancelled):
+            job.state = CANCELLED
+            job.error = str(future.exception())
+        elif future.exception() is not None:
+            job.state = FAILED
+            job.error = f"{type(future.exception()).__name__}: {future.exception()}"
+        else:
+            job.state = SUCCEEDED
+            job.result = future.result()
+        job.finished_at = time.time()
+        job.future = None
+        metrics.jobs_pending.dec()
+        metrics.jobs_total.inc(state=job.state)
+        try:
+            self.progress.pop(job.job_id, None)
+            self.cancel_requests.pop(job.job_id, None)
+        except (OSError, EOFError):
+            pass  # Manager already shut down at interpreter exit
+
+    def get(self, job_id):
+        with self.lock:
+            self._prune()
+            return self.jobs.get(job_id)
+
+    def cancel(self, job_id):
+        """
+        Cancel a job. Queued jobs are dropped at once; running jobs stop at their next
+        stage boundary (a solver already running is not interrupted).
+
+        Returns:
+            Job | None: The job, or None if it does not exist.
+        """
+        job = self.get(job_id)
+        if job is None or job.done:
+            return job
+        job.cancel_requested = True
+        if job.future is not None and job.future.cancel():
+            return job
+        self.cancel_requests[job_id] = True
+        return job
+
+    def describe(self, job):
+        """JSON-ready state of a job, with queue position or progress and the result once finished."""
+        data = {
+            "jobId": job.job_id,
+            "state": job.state,
+            "submittedAt": job.submitted_at,
+        }
+        if job.done:
+            data["finishedAt"] = job.finished_at
+            if job.error is not None:
+                data["error"] = job.error
+            if job.result is not None:
+                data["result"] = job.result
+            return data
+
+        progress = self.progress.get(job.job_id)
+        if progress is not None:
+            data["state"] = RUNNING
+            data["startedAt"] = progress.pop('startedAt')
+            data["progress"] = progress
+        else:
+            with self.lock:
+                waiting = [other for other in self.jobs.values() if not other.done and other.job_id not in self.progress]
+            data["position"] = next((i for i, other in enumerate(waiting) if other is job), 0)
+        if job.cancel_requested:
+            data["cancelRequested"] = True
+        return data
+
+
+job_queue = JobQueue()
@@ -185,15 +185,22 @@
 from data_structures import *
 from visualize import *
 from optimizer import optimize_routes, calculate_distance
+from allocation import allocate_units
+from instance_snapshot import load_instance
+import sys, time
 
 def main():
-    # Generate all possible items (this remains the same)
-    all_items = []
-    all_items.extend(create_items(1, 2, 2, 2, 5, stackable=True, fragile=False, supplier_id=None, warehouse_id=None, quantity=30))
-    all_items.extend(create_items(2, 1, 1, 1, 2, stackable=True, fragile=True, supplier_id=None, warehouse_id=None, quantity=30))
-    all_items.extend(create_items(3, 3, 2, 1, 4, stackable=False, fragile=False, supplier_id=None, warehouse_id=None, quantity=30))
-    all_items.extend(create_items(4, 2, 1, 1, 3, stackable=False, fragile=True, supplier_id=None, warehouse_id=None, quantity=30))
-    all_items.extend(create_items(5, 4, 3, 2, 6, stackable=True, fragile=False, supplier_id=None, warehouse_id=None, quantity=30))
+    # SKU catalogue: dimensions, weight, flags and 30 units of each
+    catalogue = ItemBatch(
+        ids=[1, 2, 3, 4, 5],
+        lengths=[2, 1, 3, 2, 4],
+        widths=[2, 1, 2, 1, 3],
+        heights=[2, 1, 1, 1, 2],
+        weights=[5, 2, 4, 3, 6],
+        stackable=[True, True, False, False, True],
+        fragile=[False, True, False, True, False],
+        counts=[30] * 5,
+    )
 
     # Define orders with quantities (the quantity here will match the number of separate Item objects)
     orders = [
@@ -219,26 +226,8 @@ def main():
         Truck(3, "Truck C", Bin(18, 4, 8)),
     ]
 
-    # Filter items to only those that are in the orders
-    items = []
-    for order in orders:
-        for item_id, quantity in order.items:
-            matching_items = [item for item in all_items if item.id == item_id and item not in items]
-            for i in range(quantity):
-                item = matching_items[i]
-                item.warehouse_id = order.warehouse_id  # Assign the correct warehouse
-                item.quantity_id = len([it for it in items if it.id == item_id]) + 1  # Ensure unique quantity_id
-                items.append(item)
-    
-    # Calculate warehouse demand from filtered items
-    for warehouse in warehouses:
-        warehouse.demand = {}
-        for item in items:
-            if item.warehouse_id == warehouse.warehouse_id:
-                if item.id in warehouse.demand:
-                    warehouse.demand[item.id] += 1
-                else:
-                    warehouse.demand[item.id] = 1
+    # Assign the ordered units to warehouses and calculate warehouse demand
+    items = allocate_units(orders, catalogue, warehouses)
     
     # Debugging: Print out the items, suppliers, and warehouses before optimization
     def debug_data(suppliers, warehouses, trucks, items):
@@ -289,5 +278,28 @@ def main():
     for truck in trucks:
         visualize_packing(truck.bin)
 
-if _name_ == "_main_":
-    main()
\ No newline at end of file
+def replay(path):
+    """Re-run optimize_routes on a snapshot written by instance_snapshot.save_instance."""
+    started = time.perf_counter()
+    instance = load_instance(path)
+    print(f"Loaded {path} in {time.perf_counter() - started:.3f}s: {len(instance.orders)} orders, "
+          f"{len(instance.catalogue)} SKUs, {len(instance.suppliers)} suppliers, "
+          f"{len(instance.warehouses)} warehouses, {len(instance.trucks)} trucks")
+
+    items = allocate_units(instance.orders, instance.catalogue, instance.warehouses)
+    started = time.perf_counter()
+    assignments = optimize_routes(instance.suppliers, instance.warehouses, instance.trucks, instance.orders, items,
+                                  travel_distances=instance.distances)
+    print(f"Solved in {time.perf_counter() - started:.3f}s")
+
+    for truck in instance.trucks:
+        print(f"Truck {truck.truck_id}: {len(truck.bin.items)} items")
+    if instance.assignments is not None:
+        same = sorted(assignments) == sorted(instance.assignments)
+        print(f"Assignments {'match' if same else 'differ from'} the captured solution")
+
+if __name__ == "__main__":
+    if len(sys.argv) == 3 and sys.argv[1] == '--replay':
+        replay(sys.argv[2])
+    else:
+        main()
\ No newline at end of file
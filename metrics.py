@@ -0,0 +1,161 @@
+import threading
+from bisect import bisect_left
+
+# In-process metrics rendered in the Prometheus text format by the /metrics route.
+# Each worker process keeps its own values; Prometheus sums them across targets.
+
+PREFIX = 'optisupply_'
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600)
+SIZE_BUCKETS = (10, 100, 1000, 10000, 100000, 1000000, 10000000)
+RATIO_BUCKETS = (0.1, 0.2, 0.3, 0.4, 0.5, 0.6, 0.7, 0.8, 0.9, 0.95, 1.0)
+
+_registry = []
+
+
+def _label_key(labelnames, labels):
+    return tuple(str(labels.get(name, '')) for name in labelnames)
+
+
+def _format_labels(labelnames, key, extra=()):
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(labelnames, key)]
+    pairs.extend(f'{name}="{value}"' for name, value in extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+def _escape(value):
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+class Counter:
+    kind = 'counter'
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = PREFIX + name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.values = {}
+        self.lock = threading.Lock()
+        _registry.append(self)
+
+    def inc(self, amount=1, **labels):
+        key = _label_key(self.labelnames, labels)
+        with self.lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+    def samples(self):
+        with self.lock:
+            values = dict(self.values)
+        for key, value in values.items():
+            yield self.name, _format_labels(self.labelnames, key), value
+
+
+class Gauge(Counter):
+    kind = 'gauge'
+
+    def dec(self, amount=1, **labels):
+        self.inc(-amount, **labels)
+
+    def set(self, value, **labels):
+        key = _label_key(self.labelnames, labels)
+        with self.lock:
+            self.values[key] = value
+
+
+class Histogram:
+    kind = 'histogram'
+
+    def __init__(self, name, documentation, buckets=LATENCY_BUCKETS, labelnames=()):
+        self.name = PREFIX + name
+        self.documentation = documentation
+        self.buckets = tuple(buckets)
+        self.labelnames = tuple(labelnames)
+        self.values = {}
+        self.lock = threading.Lock()
+        _registry.append(self)
+
+    def observe(self, value, **labels):
+        key = _label_key(self.labelnames, labels)
+        index = bisect_left(self.buckets, value)
+        with self.lock:
+            state = self.values.get(key)
+            if state is None:
+                # Per-bucket (non-cumulative) counts, sum, count
+                state = self.values[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            state[0][index] += 1
+            state[1] += value
+            state[2] += 1
+
+    def samples(self):
+        with self.lock:
+            values = {key: ([*state[0]], state[1], state[2]) for key, state in self.values.items()}
+        for key, (counts, total, count) in values.items():
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + ('+Inf',), counts):
+                cumulative += bucket_count
+                yield self.name + '_bucket', _format_labels(self.labelnames, key, [('le', bound)]), cumulative
+            yield self.name + '_sum', _format_labels(self.labelnames, key), total
+            yield self.name + '_count', _format_labels(self.labelnames, key), count
+
+
+def render():
+    """Render every registered metric in the Prometheus text exposition format."""
+    lines = []
+    for metric in _registry:
+        lines.append(f"# HELP {metric.name} {metric.documentation}")
+        lines.append(f"# TYPE {metric.name} {metric.kind}")
+        for name, labels, value in metric.samples():
+            lines.append(f"{name}{labels} {value}")
+    return '\n'.join(lines) + '\n'
+
+
+# Distance cache
+distance_lookups = Counter('distance_lookups_total', "Distance lookups by result (snapshot, cache or miss)", ['result'])
+distance_resolve_seconds = Histogram('distance_resolve_seconds', "Time to resolve a batch of distance cache misses")
+distance_resolved = Counter('distance_resolved_total', "Distances computed after a cache miss", ['method'])
+
+# Solver models
+solver_status = Counter('solver_status_total', "Solver runs by model and LpStatus", ['model', 'status'])
+solver_seconds = Histogram('solver_seconds', "Solver wall time", labelnames=['model'])
+model_rows = Histogram('model_rows', "Constraints per built model", SIZE_BUCKETS, ['model'])
+model_cols = Histogram('model_cols', "Variables per built model", SIZE_BUCKETS, ['model'])
+model_nonzeros = Histogram('model_nonzeros', "Constraint matrix nonzeros per built model", SIZE_BUCKETS, ['model'])
+
+# Packing
+packing_volume_utilisation = Histogram('packing_volume_utilisation', "Packed volume / bin volume per packing", RATIO_BUCKETS)
+packing_placed_ratio = Histogram('packing_placed_ratio', "Placed items / requested items per packing", RATIO_BUCKETS)
+packing_template_lookups = Counter('packing_template_lookups_total', "Packing model template lookups by result (hit or miss)", ['result'])
+heuristic_first = Counter('heuristic_first_total', "Heuristic-first packings by result (complete, incumbent for the MILP, or rejected by the model)", ['result'])
+packing_insertions = Counter('packing_insertions_total', "Late insertions into packed bins by method (extreme_point or region)", ['method'])
+
+# HTTP
+request_seconds = Histogram('request_seconds', "Request latency by endpoint", labelnames=['endpoint'])
+requests_total = Counter('requests_total', "Requests by endpoint and status code", ['endpoint', 'code'])
+requests_in_progress = Gauge('requests_in_progress', "Requests currently being handled", ['endpoint'])
+
+# Result cache
+result_cache_lookups = Counter('result_cache_lookups_total', "Result cache lookups by endpoint and result (hit, shared or miss)", ['endpoint', 'result'])
+
+# Background solve jobs
+jobs_pending = Gauge('jobs_pending', "Jobs queued or running")
+jobs_total = Counter('jobs_total', "Finished jobs by final state", ['state'])
+
+# Engine selection (model_estimate.choose_engine)
+engine_selections = Counter('engine_selections_total', "Engine chosen per model from its estimated size", ['model', 'engine'])
+portfolio_wins = Counter('portfolio_wins_total', "Portfolio races by model and winning contestant", ['model', 'contestant'])
+
+# Deadline budgeting
+degraded_stages = Counter('degraded_stages_total', "Stages that ran out of their time share, by stage and fallback", ['stage', 'fallback'])
+
+# Streamed solves
+streams_closed = Counter('solve_streams_closed_total', "Streamed solves stopped because the client disconnected, by stage", ['stage'])
+
+# Batch packing
+pack_batch_jobs = Counter('pack_batch_jobs_total', "Batch packing jobs by result (success, error or timeout)", ['status'])
+
+
+def observe_model(model, size):
+    """Record the rows/cols/nonzeros returned by tracing.model_size."""
+    model_rows.observe(size['rows'], model=model)
+    model_cols.observe(size['cols'], model=model)
+    model_nonzeros.observe(size['nonzeros'], model=model)
@@ -0,0 +1,172 @@
+import math, threading
+from collections import Counter, defaultdict, deque
+import metrics
+
+# Model sizes are predicted in closed form from the bin and item dimensions,
+# without building the PuLP model, so a request can be routed to an engine it
+# can finish with. The counts match tracing.model_size of the built models.
+
+# Largest models (constraint nonzeros) solved as they are, and with a heuristic
+# warm start; anything bigger goes to the heuristic engine
+ENGINE_LIMITS = {
+    'packing': {'exact': 200_000, 'warm_start': 2_000_000},
+    'routes': {'exact': 500_000, 'warm_start': 5_000_000},
+}
+
+# PuLP model build plus LP file write time per constraint nonzero (seconds); with
+# packing templates the build is about 0.5e-6 of it, writing the LP file 1.7e-6
+BUILD_SECONDS_PER_NONZERO = 2.5e-6
+
+# Solves remembered per model for the solve time fit, and the number needed before it is used
+CALIBRATION_SAMPLES = 200
+MIN_CALIBRATION_SAMPLES = 10
+
+EXACT, WARM_START, HEURISTIC = 'exact', 'warm_start', 'heuristic'
+
+
+def _span_sum(lo_offset, hi_limit, first, last, length):
+    """Sum over d in [first, last] of |[max(0, d + lo_offset), min(d + length, hi_limit))|."""
+    return sum(max(0, min(d + length, hi_limit) - max(0, d + lo_offset)) for d in range(first, last + 1))
+
+
+def _corner_span(size_b, hi_limit, last, length):
+    """Sum over d in [0, last] of the distinct max(d, d1) for d1 in [max(0, d - size_b + 1), min(d + length, hi_limit))."""
+    total = 0
+    for d in range(last + 1):
+        end = min(d + length, hi_limit)
+        if max(0, d - size_b + 1) < end:
+            total += max(1, end - d)
+    return total
+
+
+def estimate_packing(bin, items, formulation=None):
+    """
+    Rows, columns and nonzeros of the optimize_packing model for `items` in `bin`,
+    with the fragile rows in `formulation` (packing_templates.FRAGILE_FORMULATION
+    by default). Items are grouped by dimensions, so the cost grows with the
+    number of distinct box sizes, not with the number of items.
+    """
+    from packing_templates import FRAGILE_FORMULATION
+
+    tight = (formulation or FRAGILE_FORMULATION) == 'tight'
+    L, W, H = bin.length, bin.width, bin.height
+    kinds = Counter((item.length, item.width, item.height, bool(item.fragile)) for item in items)
+    sizes = Counter()
+    for (l, w, h, _), count in kinds.items():
+        sizes[(l, w, h)] += count
+
+    def positions(l, w, h):
+        return max(0, L - l + 1) * max(0, W - w + 1) * max(0, H - h + 1)
+
+    cols = sum(positions(l, w, h) * count for (l, w, h, _), count in kinds.items())
+    rows = len(items) + L * W * H
+    nonzeros = cols + sum(positions(l, w, h) * l * w * h * count for (l, w, h, _), count in kinds.items())
+
+    for (l, w, h, fragile), count in kinds.items():
+        if L < l or W < w or H <= h:
+            continue
+        layer_rows = (L - l + 1) * (W - w + 1) * (H - h)
+        support = top = cliques = 0
+        for (lb, wb, hb), others in sizes.items():
+            others -= (lb, wb, hb) == (l, w, h)
+            if not others or L < lb or W < wb or H < hb:
+                continue
+            # Items directly below: origin inside the footprint, at height dz - h
+            sx = _span_sum(0, L - lb + 1, 0, L - l, l)
+            sy = _span_sum(0, W - wb + 1, 0, W - w, w)
+            sz = sum(1 for dz in range(1, H - h + 1) if 0 <= dz - h <= H - hb)
+            support += others * sx * sy * sz
+            if fragile:
+                # Items overlapping the footprint whose origin is within one box height above
+                tx = _span_sum(1 - lb, L - lb + 1, 0, L - l, l)
+                ty = _span_sum(1 - wb, W - wb + 1, 0, W - w, w)
+                tz = sum(max(0, min(dz + h + hb, H, H - hb + 1) - (dz + h)) for dz in range(H - h))
+                top += others * tx * ty * tz
+                # One clique row per box size and covered cell (x and y from the footprint corner on)
+                cliques += _corner_span(lb, L - lb + 1, L - l, l) * _corner_span(wb, W - wb + 1, W - w, w) * tz
+        if tight:
+            # Every item is kept off the air once; fragile items get one row per clique above them
+            rows += count * (layer_rows + cliques)
+            nonzeros += count * (layer_rows + support + (cliques + top if fragile else 0))
+            continue
+        # Every item is kept off the air; fragile items get the same rows again plus the no-stacking rows
+        copies = 2 if fragile else 1
+        rows += count * layer_rows * (copies + fragile)
+        nonzeros += count * (copies * (layer_rows + support) + (layer_rows + top if fragile else 0))
+
+    return {"rows": rows, "cols": cols, "nonzeros": nonzeros}
+
+
+def estimate_assignment(suppliers, warehouses, items):
+    """Rows, columns and nonzeros of the optimizer.solve_assignment model."""
+    S, W, n = len(suppliers), len(warehouses), len(items)
+    units = Counter(item.id for item in items)
+    demand_rows = sum(len(w.demand) for w in warehouses)
+    demand_nonzeros = sum(S * units[item_id] for w in warehouses for item_id in w.demand)
+    return {
+        "rows": S * n + demand_rows + n,
+        "cols": S * W * n,
+        "nonzeros": S * n * W + demand_nonzeros + n * S * W,
+    }
+
+
+class SolveTimeModel:
+    """
+    Solve times of finished solves, fitted per model as log(seconds) against
+    log(nonzeros) once enough of them have been seen in this process.
+    """
+
+    def __init__(self, samples=CALIBRATION_SAMPLES):
+        self.samples = defaultdict(lambda: deque(maxlen=samples))
+        self.lock = threading.Lock()
+
+    def observe(self, model, nonzeros, seconds):
+        if nonzeros > 0 and seconds > 0:
+            with self.lock:
+                self.samples[model].append((math.log(nonzeros), math.log(seconds)))
+
+    def predict(self, model, nonzeros):
+        """Predicted solve seconds, or None while the model is not calibrated."""
+        with self.lock:
+            points = list(self.samples.get(model, ()))
+        if len(points) < MIN_CALIBRATION_SAMPLES or nonzeros <= 0:
+            return None
+        mean_x = sum(x for x, _ in points) / len(points)
+        mean_y = sum(y for _, y in points) / len(points)
+        var_x = sum((x - mean_x) ** 2 for x, _ in points)
+        slope = sum((x - mean_x) * (y - mean_y) for x, y in points) / var_x if var_x else 0.0
+        return math.exp(mean_y + slope * (math.log(nonzeros) - mean_x))
+
+
+solve_times = SolveTimeModel()
+
+
+def choose_engine(model, estimate, time_limit=None):
+    """
+    Pick the engine for a model of the estimated size: "exact", "warm_start" or
+    "heuristic". A model is also moved down a level when its predicted build and
+    solve time does not fit in `time_limit`.
+
+    Returns:
+        tuple: (engine, predicted seconds or None)
+    """
+    limits = ENGINE_LIMITS[model]
+    nonzeros = estimate["nonzeros"]
+    build = nonzeros * BUILD_SECONDS_PER_NONZERO
+    solve = solve_times.predict(model, nonzeros)
+    predicted = build + solve if solve is not None else None
+
+    if nonzeros > limits['warm_start']:
+        engine = HEURISTIC
+    elif nonzeros > limits['exact']:
+        engine = WARM_START
+    else:
+        engine = EXACT
+    if time_limit is not None and engine != HEURISTIC:
+        if build >= time_limit:
+            engine = HEURISTIC
+        elif engine == EXACT and predicted is not None and predicted > time_limit:
+            # Still solvable, but only with a good incumbent from the start
+            engine = WARM_START
+    metrics.engine_selections.inc(model=model, engine=engine)
+    return engine, predicted
@@ -1,25 +1,217 @@
-import osmnx as ox
-from pulp import LpProblem, LpMinimize, LpVariable, lpSum, GUROBI_CMD, LpStatus, value
-from item_placement import optimize_packing
-import networkx as nx
 from collections import defaultdict
-from geopy.distance import geodesic
-import pickle, os
+import atexit, logging, pickle, os, threading, time
+from concurrent.futures import ProcessPoolExecutor, as_completed, TimeoutError
 from functools import lru_cache
+from road_network import get_road_graph, snap_locations, load_osmnx, road_graph_covers
+from tracing import span, model_size
+from fleet import FleetCapacity
+from deadline import MIN_SOLVER_SECONDS, stopped_without_solution
+from heuristic_packing import extreme_point_packing
+from model_estimate import estimate_assignment, choose_engine, solve_times, WARM_START, HEURISTIC
+import metrics
+
+# Heavy dependencies (osmnx, networkx, geopy, numpy, PuLP) are imported where they
+# are first needed so that importing this module stays cheap for the service and CLI.
+
+# Full assignment lists, off unless this logger is set to DEBUG
+logger = logging.getLogger('optisupply.routes')
 
 # File to store the distance cache
 CACHE_FILE = 'distance_cache.pkl'
 
-# Load existing cache from file if it exists
-if os.path.exists(CACHE_FILE):
-    with open(CACHE_FILE, 'rb') as f:
-        distance_cache = pickle.load(f)
-else:
-    distance_cache = {}
+# Loaded from CACHE_FILE on first use, see get_distance_cache
+distance_cache = None
+_cache_from_file = False
+
+# Distances resolved here are published to the shared snapshot in batches of this
+# many pairs, or once the oldest unpublished one has waited PUBLISH_INTERVAL seconds
+PUBLISH_BATCH_PAIRS = 500
+PUBLISH_INTERVAL = 60.0
+
+_unpublished = {}
+_unpublished_since = None
+_publish_lock = threading.Lock()
+
+# Read-only distance matrix shared by all worker processes (see distance_snapshot.py)
+shared_snapshot = None
+
+# Contraction hierarchy, memory-mapped on the first routed distance (see ch_index.py)
+ch_index = None
+_ch_index_loaded = False
+
+
+def get_distance_cache():
+    global distance_cache, _cache_from_file
+    if distance_cache is None:
+        if get_shared_snapshot().snapshot is not None:
+            # Workers share the snapshot's mapped matrix; this only holds what they resolve themselves
+            distance_cache = {}
+            _cache_from_file = False
+        else:
+            # Load existing cache from file if it exists
+            _cache_from_file = True
+            if os.path.exists(CACHE_FILE):
+                with open(CACHE_FILE, 'rb') as f:
+                    distance_cache = pickle.load(f)
+            else:
+                distance_cache = {}
+    return distance_cache
+
+
+def get_shared_snapshot():
+    global shared_snapshot
+    if shared_snapshot is None:
+        from distance_snapshot import SharedDistanceSnapshot
+        shared_snapshot = SharedDistanceSnapshot()
+    return shared_snapshot
+
+
+def get_ch_index():
+    global ch_index, _ch_index_loaded
+    if not _ch_index_loaded:
+        from ch_index import load_ch_index
+        ch_index = load_ch_index()
+        _ch_index_loaded = True
+    return ch_index
+
+
+def geodesic_distance(loc1, loc2):
+    from geopy.distance import geodesic
+    return geodesic(loc1, loc2).meters
+
+
+# Upper bound on worker processes used to resolve distance cache misses
+DISTANCE_WORKERS = os.cpu_count() or 1
+
+# Fewer misses than this are resolved in the request thread (a pool is not worth starting)
+PARALLEL_MISS_THRESHOLD = 4
+
+# Time a road graph download and projection is assumed to take; under a time limit
+# shorter than this, with no covering graph in memory, pairs get geodesic distances (seconds)
+GRAPH_LOAD_SECONDS = 30
+
+# Progress of running distance matrix builds, keyed by request id
+distance_progress = {}
+
+
+class DistanceProgress:
+    def __init__(self, total):
+        self.total = total
+        self.done = 0
+        self.started_at = time.time()
+        self.finished = total == 0
+        self.approximate = 0  # Pairs given a geodesic distance because the time ran out
+
+    def advance(self, count=1):
+        self.done += count
+
+    def eta(self):
+        """Estimated seconds until all pending distances are resolved, None before the first one."""
+        if self.finished or self.done == self.total:
+            return 0.0
+        if self.done == 0:
+            return None
+        elapsed = time.time() - self.started_at
+        return elapsed / self.done * (self.total - self.done)
+
+    def as_dict(self):
+        return {
+            "total": self.total,
+            "done": self.done,
+            "elapsed": time.time() - self.started_at,
+            "eta": self.eta(),
+            "finished": self.finished,
+            "approximate": self.approximate
+        }
+
+
+def _network_distance(G, loc1, loc2, start_node, end_node):
+    import networkx as nx
+
+    print(f"Start node: {start_node}, End node: {end_node}")
+    
+    ch_index = get_ch_index()
+    if start_node == end_node:
+        return geodesic_distance(loc1, loc2)
+    if ch_index is not None and start_node in ch_index and end_node in ch_index:
+        distance = ch_index.distance(start_node, end_node)
+        if distance == float('inf'):
+            print(f"No path found. Using geodesic distance.")
+            return geodesic_distance(loc1, loc2)
+        print(f"Calculated network distance from index: {distance} meters")
+        return distance
+    try:
+        path = nx.shortest_path(G, start_node, end_node, weight='length')
+        distance = sum(load_osmnx().utils_graph.get_route_edge_attributes(G, path, 'length'))
+        print(f"Calculated network distance: {distance} meters")
+        return distance
+    except nx.NetworkXNoPath:
+        print(f"No path found. Using geodesic distance.")
+        return geodesic_distance(loc1, loc2)
+
+
+def save_distance_cache():
+    # Without the pickled entries loaded, writing the file would drop them; the snapshot persists instead
+    if _cache_from_file:
+        with open(CACHE_FILE, 'wb') as f:
+            pickle.dump(get_distance_cache(), f)
+
+
+def publish_distances(force=False):
+    """
+    Publish the distances resolved since the last publish to the shared snapshot
+    once there are PUBLISH_BATCH_PAIRS of them or the oldest is PUBLISH_INTERVAL
+    seconds old (or right away with `force`).
+    """
+    global _unpublished_since
+    from distance_snapshot import publish_snapshot
+
+    with _publish_lock:
+        if not _unpublished:
+            return
+        due = (len(_unpublished) >= PUBLISH_BATCH_PAIRS
+               or time.time() - _unpublished_since >= PUBLISH_INTERVAL)
+        if not (force or due):
+            return
+        snapshot = get_shared_snapshot()
+        # The first snapshot starts from the pickled cache this process loaded
+        batch = dict(get_distance_cache()) if snapshot.snapshot is None else dict(_unpublished)
+        publish_snapshot(batch)
+        _unpublished.clear()
+        _unpublished_since = None
+        snapshot.reload()
+
+
+def remember_distances(distances):
+    """Keep resolved distances ({cache key: meters}) in this process and queue them for the snapshot."""
+    global _unpublished_since
+    from distance_snapshot import SNAPSHOT_DIR
+
+    get_distance_cache().update(distances)
+    save_distance_cache()
+    if not distances or not os.path.exists(SNAPSHOT_DIR):
+        return
+    with _publish_lock:
+        if _unpublished_since is None:
+            _unpublished_since = time.time()
+        _unpublished.update(distances)
+    publish_distances()
+
+
+# Whatever is still queued when the process exits is published then
+atexit.register(publish_distances, force=True)
+
+
+def cached_distance(loc1, loc2):
+    """Look a distance up in the shared snapshot, then in this process's cache; None if unknown."""
+    distance = get_shared_snapshot().lookup(loc1, loc2)
+    if distance is not None:
+        metrics.distance_lookups.inc(result="snapshot")
+        return distance
+    distance = get_distance_cache().get(f"{loc1}_{loc2}")
+    metrics.distance_lookups.inc(result="cache" if distance is not None else "miss")
+    return distance
 
-# Set up OSMnx to use the cache directory
-ox.settings.use_cache = True
-ox.settings.cache_folder = 'C:\\Users\\arpan\\OneDrive\\Desktop\\logistics_project\\osmnx_cache'
 
 @lru_cache(maxsize=128)
 def calculate_distance(loc1, loc2):
@@ -27,70 +219,176 @@ def calculate_distance(loc1, loc2):
     cache_key = f"{loc1}_{loc2}"
     
     # Check if the distance is in the cache
-    if cache_key in distance_cache:
+    distance = cached_distance(loc1, loc2)
+    if distance is not None:
         print(f"Using cached distance for {loc1} to {loc2}")
-        return distance_cache[cache_key]
-    
-    latitude1, longitude1 = loc1
-    latitude2, longitude2 = loc2
+        return distance
     
     print(f"Calculating distance between {loc1} and {loc2}")
     
-    # Create a new graph for each calculation
-    north = max(latitude1, latitude2) + 0.1
-    south = min(latitude1, latitude2) - 0.1
-    east = max(longitude1, longitude2) + 0.1
-    west = min(longitude1, longitude2) - 0.1
-    
     try:
-        # This will use the OSMnx cache if available
-        G = ox.graph_from_bbox(north, south, east, west, network_type='drive')
-        G = ox.project_graph(G)
-        
-        start_node = ox.distance.nearest_nodes(G, longitude1, latitude1)
-        end_node = ox.distance.nearest_nodes(G, longitude2, latitude2)
-        
-        print(f"Start node: {start_node}, End node: {end_node}")
-        
-        if start_node == end_node:
-            distance = geodesic(loc1, loc2).meters
-        else:
-            try:
-                path = nx.shortest_path(G, start_node, end_node, weight='length')
-                distance = sum(ox.utils_graph.get_route_edge_attributes(G, path, 'length'))
-                print(f"Calculated network distance: {distance} meters")
-            except nx.NetworkXNoPath:
-                print(f"No path found. Using geodesic distance.")
-                distance = geodesic(loc1, loc2).meters
+        # Reuse the shared road graph and the persisted node snapping
+        G = get_road_graph([loc1, loc2])
+        start_node, end_node = snap_locations([loc1, loc2], G)
+        distance = _network_distance(G, loc1, loc2, start_node, end_node)
     
     except Exception as e:
         print(f"Error in distance calculation: {str(e)}. Using geodesic distance.")
-        distance = geodesic(loc1, loc2).meters
+        distance = geodesic_distance(loc1, loc2)
 
-    # Store the calculated distance in the cache
-    distance_cache[cache_key] = distance
-    
-    # Save the updated cache to file
-    with open(CACHE_FILE, 'wb') as f:
-        pickle.dump(distance_cache, f)
+    # Store the calculated distance in the cache (and the next snapshot publish)
+    remember_distances({cache_key: distance})
     
     return distance
 
+
+# The road graph is handed to every pool worker once, not with every task
+_worker_graph = None
+
+def _init_distance_worker(G):
+    global _worker_graph
+    _worker_graph = G
+
+
+def _resolve_pair(loc1, loc2, start_node, end_node):
+    return _network_distance(_worker_graph, loc1, loc2, start_node, end_node)
+
+
+def resolve_missing_distances(pairs, progress=None, time_limit=None):
+    """
+    Calculate uncached distances concurrently and write them to the cache in one batch.
+
+    Args:
+        pairs (list[tuple]): (loc1, loc2) location pairs missing from the cache.
+        progress (DistanceProgress, optional): Advanced as each pair is resolved.
+        time_limit (float, optional): Seconds to spend on road distances. Pairs still
+            open then get their geodesic distance, which is returned but not cached.
+    """
+    progress = progress or DistanceProgress(len(pairs))
+    started_at = time.time()
+    stop_at = started_at + time_limit if time_limit is not None else None
+    locations = list(dict.fromkeys(loc for pair in pairs for loc in pair))
+    results = {}
+    G = None
+    out_of_time = stop_at is not None and (
+        time.time() >= stop_at or (time_limit < GRAPH_LOAD_SECONDS and not road_graph_covers(locations)))
+    if out_of_time:
+        # A graph download would not fit in the time limit; every pair falls back below
+        print(f"No time to load the road graph for {len(pairs)} pairs. Using geodesic distances.")
+    else:
+        try:
+            G = get_road_graph(locations)
+            nodes = dict(zip(locations, snap_locations(locations, G)))
+        except Exception as e:
+            print(f"Error while loading the road graph: {str(e)}. Using geodesic distances.")
+            G = None
+
+    if out_of_time:
+        pass
+    elif G is None:
+        for loc1, loc2 in pairs:
+            results[f"{loc1}_{loc2}"] = geodesic_distance(loc1, loc2)
+            progress.advance()
+        metrics.distance_resolved.inc(len(pairs), method="geodesic")
+    elif len(pairs) < PARALLEL_MISS_THRESHOLD or DISTANCE_WORKERS <= 1:
+        for loc1, loc2 in pairs:
+            if stop_at is not None and time.time() >= stop_at:
+                break
+            results[f"{loc1}_{loc2}"] = _network_distance(G, loc1, loc2, nodes[loc1], nodes[loc2])
+            progress.advance()
+        metrics.distance_resolved.inc(len(results), method="serial")
+    else:
+        print(f"Resolving {len(pairs)} distances with {min(DISTANCE_WORKERS, len(pairs))} workers")
+        pool = ProcessPoolExecutor(max_workers=min(DISTANCE_WORKERS, len(pairs)),
+                                   initializer=_init_distance_worker, initargs=(G,))
+        try:
+            futures = {pool.submit(_resolve_pair, loc1, loc2, nodes[loc1], nodes[loc2]): (loc1, loc2)
+                       for loc1, loc2 in pairs}
+            timeout = max(0.0, stop_at - time.time()) if stop_at is not None else None
+            for future in as_completed(futures, timeout=timeout):
+                loc1, loc2 = futures[future]
+                try:
+                    distance = future.result()
+                except Exception as e:
+                    print(f"Error in distance calculation: {str(e)}. Using geodesic distance.")
+                    distance = geodesic_distance(loc1, loc2)
+                results[f"{loc1}_{loc2}"] = distance
+                progress.advance()
+        except TimeoutError:
+            print(f"Distance time limit reached with {len(pairs) - len(results)} pairs open")
+        finally:
+            # Past the time limit the request does not wait for routes still being computed
+            pool.shutdown(wait=stop_at is None, cancel_futures=True)
+        metrics.distance_resolved.inc(len(results), method="parallel")
+
+    exact = dict(results)
+    for loc1, loc2 in pairs:
+        if f"{loc1}_{loc2}" not in results:
+            results[f"{loc1}_{loc2}"] = geodesic_distance(loc1, loc2)
+            progress.approximate += 1
+            progress.advance()
+    if progress.approximate:
+        metrics.distance_resolved.inc(progress.approximate, method="geodesic")
+
+    # Visible to every worker with the next snapshot publish
+    remember_distances(exact)
+    progress.finished = True
+    metrics.distance_resolve_seconds.observe(time.time() - started_at)
+    return results
+
+
 # Function to clear the distance cache (call this if you need to reset the cache)
 def clear_distance_cache():
-    global distance_cache
-    distance_cache.clear()
+    get_distance_cache().clear()
     if os.path.exists(CACHE_FILE):
         os.remove(CACHE_FILE)
     print("Distance cache cleared")
 
 # Function to clear the OSMnx cache (use with caution)
 def clear_osmnx_cache():
-    ox.settings.cache_folder = 'C:\\Users\\arpan\\OneDrive\\Desktop\\logistics_project\\osmnx_cache'
+    ox = load_osmnx()
     ox.utils.config.cache_clear()
     print("OSMnx cache cleared")
 
 
+def build_distance_matrix(suppliers, warehouses, request_id=None, deadline=None):
+    """
+    Calculate the supplier to warehouse distances. Pairs missing from the cache
+    are collected first and resolved together by resolve_missing_distances.
+
+    Args:
+        request_id (str, optional): Key under which progress is published in distance_progress.
+        deadline (Deadline, optional): Request budget; uncached pairs get the "distances"
+            share of it.
+
+    Returns:
+        dict: {(supplier_id, warehouse_id): distance in meters}
+    """
+    distances = {}
+    missing = {}
+    for s in suppliers:
+        for w in warehouses:
+            distance = cached_distance(s.location, w.location)
+            if distance is None:
+                missing.setdefault((s.location, w.location), []).append((s.supplier_id, w.warehouse_id))
+            else:
+                distances[(s.supplier_id, w.warehouse_id)] = distance
+
+    progress = DistanceProgress(len(missing))
+    if request_id is not None:
+        distance_progress[request_id] = progress
+    if missing:
+        time_limit = deadline.share('distances') if deadline is not None else None
+        results = resolve_missing_distances(list(missing), progress, time_limit)
+        if progress.approximate:
+            deadline.degrade('distances', 'geodesic', pairs=progress.approximate)
+        for (loc1, loc2), keys in missing.items():
+            for key in keys:
+                distances[key] = results[f"{loc1}_{loc2}"]
+
+    return distances
+
+
 def get_items_for_order(order, all_items):
     items_for_order = []
     for item_id, quantity in order.items:
@@ -103,89 +401,237 @@ def update_inventory(supplier, items_packed):
         supplier.inventory[item.id] -= 1
 
 from collections import defaultdict
-def optimize_routes(suppliers, warehouses, trucks, orders, items):
-    prob = LpProblem("Logistics_Optimization", LpMinimize)
+def solve_assignment(suppliers, warehouses, items, travel_distances, time_limit=None, warm_start=None,
+                     solver_options=None, return_status=False):
+    """
+    Solve the supplier/warehouse assignment MILP for every unit, optionally starting
+    from a known assignment (e.g. greedy_assignments).
 
-    # Create shipment variables for each item with its unique quantity_id
-    x = LpVariable.dicts("shipment", 
-                         [(s.supplier_id, w.warehouse_id, i.id, i.quantity_id) 
-                          for s in suppliers for w in warehouses for i in items], 
-                         lowBound=0, cat='Binary')  # Changed to Binary
+    Returns:
+        list | None: (supplier_id, warehouse_id, item_id, quantity_id, qty) tuples, or None
+            when the solver stopped at `time_limit` without any solution. With
+            `return_status`, an (assignments, LpStatus code) tuple.
+    """
+    from pulp import LpProblem, LpMinimize, LpVariable, lpSum, GUROBI_CMD, LpStatus
 
-    # Calculate travel distances
-    travel_distances = {(s.supplier_id, w.warehouse_id): calculate_distance(s.location, w.location) 
-                        for s in suppliers for w in warehouses}
+    with span("model_build") as build_span:
+        prob = LpProblem("Logistics_Optimization", LpMinimize)
 
-    # Objective: Minimize total travel distance
-    prob += lpSum(x[(s.supplier_id, w.warehouse_id, i.id, i.quantity_id)] * travel_distances[(s.supplier_id, w.warehouse_id)] 
-                   for s in suppliers for w in warehouses for i in items)
+        # Create shipment variables for each item with its unique quantity_id
+        x = LpVariable.dicts("shipment", 
+                             [(s.supplier_id, w.warehouse_id, i.id, i.quantity_id) 
+                              for s in suppliers for w in warehouses for i in items], 
+                             lowBound=0, cat='Binary')  # Changed to Binary
 
-    # Supply constraints
-    for s in suppliers:
-        for i in items:
-            if i.id in s.inventory:
-                prob += lpSum(x[(s.supplier_id, w.warehouse_id, i.id, i.quantity_id)] 
-                              for w in warehouses) <= s.inventory[i.id]
-            else:
-                # If supplier doesn't have this item, ensure it doesn't supply it
+        # Objective: Minimize total travel distance
+        prob += lpSum(x[(s.supplier_id, w.warehouse_id, i.id, i.quantity_id)] * travel_distances[(s.supplier_id, w.warehouse_id)] 
+                       for s in suppliers for w in warehouses for i in items)
+
+        # Supply constraints
+        for s in suppliers:
+            for i in items:
+                if i.id in s.inventory:
+                    prob += lpSum(x[(s.supplier_id, w.warehouse_id, i.id, i.quantity_id)] 
+                                  for w in warehouses) <= s.inventory[i.id]
+                else:
+                    # If supplier doesn't have this item, ensure it doesn't supply it
+                    prob += lpSum(x[(s.supplier_id, w.warehouse_id, i.id, i.quantity_id)] 
+                                  for w in warehouses) == 0
+
+        # Demand constraints
+        for w in warehouses:
+            for item_id, quantity in w.demand.items():
                 prob += lpSum(x[(s.supplier_id, w.warehouse_id, i.id, i.quantity_id)] 
-                              for w in warehouses) == 0
+                              for s in suppliers 
+                              for i in items if i.id == item_id) == quantity
 
-    # Demand constraints
-    for w in warehouses:
-        for item_id, quantity in w.demand.items():
+        # Ensure each item is assigned only once
+        for i in items:
             prob += lpSum(x[(s.supplier_id, w.warehouse_id, i.id, i.quantity_id)] 
-                          for s in suppliers 
-                          for i in items if i.id == item_id) == quantity
+                          for s in suppliers for w in warehouses) == 1
 
-    # Ensure each item is assigned only once
-    for i in items:
-        prob += lpSum(x[(s.supplier_id, w.warehouse_id, i.id, i.quantity_id)] 
-                      for s in suppliers for w in warehouses) == 1
+        for s_id, w_id, i_id, q_id, qty in warm_start or ():
+            x[(s_id, w_id, i_id, q_id)].setInitialValue(1)
+
+        size = model_size(prob)
+        build_span.attrs.update(size)
+        metrics.observe_model("routes", size)
 
     # Solve the problem
-    prob.solve(GUROBI_CMD(msg=1))
+    with span("solver") as solver_span:
+        try:
+            prob.solve(GUROBI_CMD(msg=1, timeLimit=time_limit, warmStart=bool(warm_start),
+                                  options=solver_options or []))
+        except TypeError as e:
+            # A missing or failing gurobi_cl raises PulpSolverError, which always propagates
+            if time_limit is None or not stopped_without_solution(e):
+                raise
+        solver_span.attrs["status"] = LpStatus[prob.status]
+    if prob.status == 1 and (time_limit is None or solver_span.wall < time_limit):
+        solve_times.observe("routes", size["nonzeros"], solver_span.wall)
+    metrics.solver_status.inc(model="routes", status=LpStatus[prob.status])
+    metrics.solver_seconds.observe(solver_span.wall, model="routes")
 
     # Extract optimized assignments
-    optimized_assignments = []
-    for s in suppliers:
-        for w in warehouses:
-            for i in items:
-                if x[(s.supplier_id, w.warehouse_id, i.id, i.quantity_id)].varValue > 0:
-                    optimized_assignments.append(
-                        (s.supplier_id, w.warehouse_id, i.id, i.quantity_id, 
-                         x[(s.supplier_id, w.warehouse_id, i.id, i.quantity_id)].varValue)
-                    )
+    with span("extraction"):
+        if any(variable.varValue is None for variable in x.values()):
+            print("The assignment solver returned no solution")
+            return (None, prob.status) if return_status else None
+        optimized_assignments = []
+        for s in suppliers:
+            for w in warehouses:
+                for i in items:
+                    if x[(s.supplier_id, w.warehouse_id, i.id, i.quantity_id)].varValue > 0:
+                        optimized_assignments.append(
+                            (s.supplier_id, w.warehouse_id, i.id, i.quantity_id, 
+                             x[(s.supplier_id, w.warehouse_id, i.id, i.quantity_id)].varValue)
+                        )
 
-    print("----------------------------------------------------------------------------------------------")
-    print(optimized_assignments)
-    print("----------------------------------------------------------------------------------------------")
+        logger.debug("Assignments: %s", optimized_assignments)
 
-    # Distribute items to trucks based on optimized routes
-    supplier_items = defaultdict(list)
+    return (optimized_assignments, prob.status) if return_status else optimized_assignments
 
-    # Collect items for each supplier
-    for s_id, w_id, i_id, q_id, qty in optimized_assignments:
-        item = next((i for i in items if i.id == i_id and i.quantity_id == q_id), None)
-        if item:
-            supplier_items[s_id].append((w_id, item, qty))
 
-    # Initialize truck index
-    truck_index = 0
+def greedy_assignments(suppliers, items, travel_distances):
+    """Send every unit to the nearest supplier that still has stock of it (the assignment fallback)."""
+    stock = {s.supplier_id: dict(s.inventory) for s in suppliers}
+    assignments = []
+    for i in items:
+        stocked = [s.supplier_id for s in suppliers if stock[s.supplier_id].get(i.id, 0) > 0]
+        if not stocked:
+            print(f"No supplier has {i.id} left for unit {i.quantity_id}")
+            continue
+        s_id = min(stocked, key=lambda s_id: travel_distances.get((s_id, i.warehouse_id), float('inf')))
+        stock[s_id][i.id] -= 1
+        assignments.append((s_id, i.warehouse_id, i.id, i.quantity_id, 1.0))
+    return assignments
 
-    # Process each supplier's items
+
+def pack_within(truck, items, time_limit, deadline, portfolio=False, blocks=False, heuristic_first=False):
+    """
+    Pack a truck with the solver limited to `time_limit`. Units the solver did not
+    place before the limit (or all of them, when the share is too small to solve)
+    are placed by the extreme-point heuristic.
+    """
+    from item_placement import pack_items
+
+    fallback = 'heuristic'
+    if time_limit >= MIN_SOLVER_SECONDS:
+        started = time.perf_counter()
+        engine, _ = pack_items(truck.bin, items, time_limit=time_limit, portfolio=portfolio, blocks=blocks,
+                               heuristic_first=heuristic_first)
+        if engine == HEURISTIC:
+            # The model would not have been built within the share
+            deadline.degrade('packing', 'heuristic', truckId=truck.truck_id)
+            return
+        if time.perf_counter() - started < time_limit:
+            return
+        fallback = 'incumbent'
+    # Item.position defaults to (0, 0, 0), so placed units are told apart by being in the bin
+    in_bin = {id(item) for item in truck.bin.items}
+    unplaced = [item for item in items if id(item) not in in_bin]
+    placed = extreme_point_packing(truck.bin, unplaced) if unplaced else 0
+    deadline.degrade('packing', fallback, truckId=truck.truck_id, heuristicPlaced=placed,
+                     unplaced=len(unplaced) - placed)
+
+
+def optimize_routes(suppliers, warehouses, trucks, orders, items, request_id=None, travel_distances=None,
+                    on_result=None, deadline=None, portfolio=False, blocks=False, heuristic_first=False):
+    """
+    Assign items to suppliers with the routing MILP, then pack each supplier's load into a truck.
+
+    `on_result`, if given, is called with ("assignments", assignments) as soon as the
+    MILP is solved and with ("truck", truck) each time a truck has been packed, so
+    callers can pass results on before the whole fleet is done.
+
+    With a `deadline` every stage gets its share of the request budget and falls back
+    (geodesic distances, greedy assignment, solver incumbent or heuristic packing)
+    when the share runs out; the fallbacks are recorded in deadline.degraded.
+
+    With `portfolio` the assignment and every packing MILP are raced across
+    several solver configurations (see portfolio.py). With `blocks` identical
+    units are packed as blocks (see block_building.py), and with
+    `heuristic_first` a truck only reaches the packing MILP when the
+    extreme-point heuristic cannot place all of its units.
+    """
+    from item_placement import pack_items
+
+    # Calculate travel distances, unless they come with the instance (snapshot replays)
+    if travel_distances is None:
+        with span("distance_matrix", pairs=len(suppliers) * len(warehouses)):
+            travel_distances = build_distance_matrix(suppliers, warehouses, request_id, deadline)
+
+    time_limit = deadline.share('assignment') if deadline is not None else None
+    with span("model_estimate") as estimate_span:
+        estimate = estimate_assignment(suppliers, warehouses, items)
+        engine, predicted = choose_engine("routes", estimate, time_limit)
+        estimate_span.attrs.update(estimate, engine=engine, predicted_seconds=predicted)
+    print(f"Assigning {len(items)} units with the {engine} engine ({estimate['nonzeros']} nonzeros)")
+
+    optimized_assignments = None
+    if portfolio and engine != HEURISTIC and (time_limit is None or time_limit >= MIN_SOLVER_SECONDS):
+        from portfolio import race_assignment
+        optimized_assignments, winner, optimal = race_assignment(suppliers, warehouses, items, travel_distances,
+                                                                 time_limit)
+        if deadline is not None and not optimal:
+            deadline.degrade('assignment', winner)
+    elif engine != HEURISTIC and (time_limit is None or time_limit >= MIN_SOLVER_SECONDS):
+        warm_start = greedy_assignments(suppliers, items, travel_distances) if engine == WARM_START else None
+        started = time.perf_counter()
+        optimized_assignments = solve_assignment(suppliers, warehouses, items, travel_distances, time_limit,
+                                                 warm_start)
+        if optimized_assignments is not None and time_limit is not None and time.perf_counter() - started >= time_limit:
+            deadline.degrade('assignment', 'incumbent')
+    if optimized_assignments is None:
+        with span("greedy_assignment", items=len(items)):
+            optimized_assignments = greedy_assignments(suppliers, items, travel_distances)
+        if deadline is not None:
+            deadline.degrade('assignment', 'greedy')
+
+    with span("extraction"):
+        # Distribute items to trucks based on optimized routes
+        supplier_items = defaultdict(list)
+
+        # Collect items for each supplier
+        for s_id, w_id, i_id, q_id, qty in optimized_assignments:
+            item = next((i for i in items if i.id == i_id and i.quantity_id == q_id), None)
+            if item:
+                supplier_items[s_id].append((w_id, item, qty))
+
+    if on_result is not None:
+        on_result("assignments", optimized_assignments)
+
+    # Check every supplier's load against the whole fleet in one pass
+    loads = []
     for s_id, items_info in supplier_items.items():
         items_to_load = []
         for w_id, item, qty in items_info:
             items_to_load.extend([item] * int(qty))
-        
-        # Select truck
-        truck = trucks[truck_index % len(trucks)]
-        
-        # Check if truck can carry all items
-        if truck.can_carry_items(items_to_load):
-            # Optimize packing for the selected truck
-            optimize_packing(truck.bin, items_to_load)
-            truck_index += 1
-
-    return optimized_assignments
\ No newline at end of file
+        loads.append((s_id, items_to_load))
+    feasibility = FleetCapacity(trucks).feasibility([items_to_load for _, items_to_load in loads])
+
+    # Initialize truck index
+    truck_index = 0
+
+    # Process each supplier's items
+    for group, (s_id, items_to_load) in enumerate(loads):
+        # Select the next truck in rotation that can carry all items
+        selected = feasibility.next_truck(group, truck_index)
+        if selected is None:
+            print(f"No truck can carry the {len(items_to_load)} items from supplier {s_id}")
+            continue
+        truck = trucks[selected]
+
+        # Optimize packing for the selected truck
+        with span("packing", truck_id=truck.truck_id, supplier_id=s_id, items=len(items_to_load)):
+            if deadline is None:
+                pack_items(truck.bin, items_to_load, portfolio=portfolio, blocks=blocks,
+                           heuristic_first=heuristic_first)
+            else:
+                pack_within(truck, items_to_load, deadline.share('packing', len(loads) - group), deadline,
+                            portfolio, blocks, heuristic_first)
+        truck_index = selected + 1
+        if on_result is not None:
+            on_result("truck", truck)
+
+    return optimized_assignments
@@ -0,0 +1,228 @@
+import os, threading
+from collections import OrderedDict
+import metrics
+
+# Templates kept, one per (bin dimensions, set of item dimensions); the least recently used is dropped
+TEMPLATE_CACHE_ENTRIES = 64
+
+# Big-M of the "nothing on top of a fragile item" rows
+FRAGILE_BIG_M = 1000
+
+# How fragile items are formulated. "big_m": the support rows are added a second
+# time and each placement gets one big-M row against everything that would rest
+# on it. "tight": the support rows once, and the big-M row split into cliques
+# (the placement plus the placements of one box size covering one cell above
+# it, <= 1). Both allow exactly the same packings; the cliques have a much
+# tighter LP relaxation for loads with many fragile items.
+FRAGILE_FORMULATION = os.environ.get('OPTISUPPLY_FRAGILE_FORMULATION', 'big_m')
+
+
+class PackingTemplate:
+    """
+    The index structure of the optimize_packing model for one bin size and one
+    set of box sizes ("types"): candidate positions per type, which placements
+    cover each cell, which placements can hold a placement up, and which would
+    sit on it. None of it depends on how many boxes of each type there are or
+    on their flags, so one template serves every load of a standard truck.
+    Positions are referred to by their index k in positions[type].
+    """
+
+    def __init__(self, length, width, height, types):
+        self.dims = (length, width, height)
+        self.types = types
+        self.type_index = {dims: t for t, dims in enumerate(types)}
+        L, W, H = length, width, height
+
+        self.positions = []
+        self.objective = []
+        for l, w, h in types:
+            positions = [(dx, dy, dz) for dx in range(L - l + 1) for dy in range(W - w + 1) for dz in range(H - h + 1)]
+            self.positions.append(positions)
+            # Ties between equally full loads are broken towards the back of the bin
+            self.objective.append([1 + 0.01 * dx / L for dx, _, _ in positions])
+        self.index = index = [{position: k for k, position in enumerate(positions)} for positions in self.positions]
+
+        # Placements (t, k) covering each cell, cells in x, y, z order
+        cover = {}
+        for t, (l, w, h) in enumerate(types):
+            for k, (dx, dy, dz) in enumerate(self.positions[t]):
+                for px in range(dx, dx + l):
+                    for py in range(dy, dy + w):
+                        for pz in range(dz, dz + h):
+                            cover.setdefault((px, py, pz), []).append((t, k))
+        self.cover = [cover.get((px, py, pz), []) for px in range(L) for py in range(W) for pz in range(H)]
+
+        # below[t]: (k, placements that hold k up) for every k above the floor
+        # above[t]: (k, placements that would rest on k) for every k below the ceiling
+        self.below = []
+        self.above = []
+        for t, (l, w, h) in enumerate(types):
+            below = []
+            above = []
+            for k, (dx, dy, dz) in enumerate(self.positions[t]):
+                if dz >= 1:
+                    below.append((k, [
+                        (b, index[b][(dx1, dy1, dz - h)])
+                        for b, (lb, wb, hb) in enumerate(types)
+                        for dx1 in range(dx, min(dx + l, L - lb + 1))
+                        for dy1 in range(dy, min(dy + w, W - wb + 1))
+                        if (dx1, dy1, dz - h) in index[b]
+                    ]))
+                if dz < H - h:
+                    above.append((k, [
+                        (b, index[b][(dx1, dy1, dz1)])
+                        for b, (lb, wb, hb) in enumerate(types)
+                        for dx1 in range(max(0, dx - lb + 1), min(dx + l, L - lb + 1))
+                        for dy1 in range(max(0, dy - wb + 1), min(dy + w, W - wb + 1))
+                        for dz1 in range(dz + h, min(dz + h + hb, H))
+                        if (dx1, dy1, dz1) in index[b]
+                    ]))
+            self.below.append(below)
+            self.above.append(above)
+        self.cliques = {}
+
+    def above_cliques(self, t):
+        """
+        above[t] with each k's resting placements split by box size and by the
+        cell (above k's footprint) they cover: (k, [(b, [q, ...]), ...]). The
+        placements of one group overlap each other, so at most one is used.
+        """
+        cliques = self.cliques.get(t)
+        if cliques is None:
+            cliques = []
+            for k, resting in self.above[t]:
+                dx, dy, _ = self.positions[t][k]
+                cells = {}
+                for b, q in resting:
+                    dx1, dy1, dz1 = self.positions[b][q]
+                    cells.setdefault((b, max(dx, dx1), max(dy, dy1), dz1), []).append(q)
+                cliques.append((k, [(cell[0], group) for cell, group in cells.items()]))
+            self.cliques[t] = cliques
+        return cliques
+
+    def admits(self, items):
+        """
+        Whether `items`, at their current positions, satisfy the constraints build()
+        adds for them: every position is a candidate, no two items share a cell,
+        every item above the floor has a supporter, and nothing rests on a fragile item.
+        """
+        placements = []
+        for item in items:
+            t = self.type_index.get((item.length, item.width, item.height))
+            k = self.index[t].get(tuple(item.position)) if t is not None else None
+            if k is None:
+                return False
+            placements.append((t, k, item))
+
+        cells = set()
+        for t, k, _ in placements:
+            l, w, h = self.types[t]
+            dx, dy, dz = self.positions[t][k]
+            for cell in ((px, py, pz) for px in range(dx, dx + l) for py in range(dy, dy + w) for pz in range(dz, dz + h)):
+                if cell in cells:
+                    return False
+                cells.add(cell)
+
+        used = {(t, k) for t, k, _ in placements}
+        below = {t: dict(self.below[t]) for t in {t for t, _, _ in placements}}
+        above = {t: dict(self.above[t]) for t in {t for t, _, item in placements if item.fragile}}
+        for t, k, item in placements:
+            if self.positions[t][k][2] >= 1 and not used.intersection(below[t][k]):
+                return False
+            if item.fragile and used.intersection(above[t].get(k, ())):
+                return False
+        return True
+
+    def build(self, prob, unique_items, formulation=None):
+        """
+        Add the variables, objective and constraints for `unique_items` ((uid, item)
+        pairs) to `prob`, exactly as optimize_packing always formulated them, with
+        the fragile rows in `formulation` (FRAGILE_FORMULATION by default).
+
+        Returns:
+            dict: {(uid, dx, dy, dz): LpVariable}
+        """
+        from pulp import LpVariable, LpAffineExpression, LpConstraint, LpConstraintLE
+
+        typed = [(uid, item, self.type_index[(item.length, item.width, item.height)]) for uid, item in unique_items]
+        x = LpVariable.dicts("item_placement",
+                             [(uid, *position) for uid, _, t in typed for position in self.positions[t]],
+                             cat='Binary')
+        # variables[i][k]: placement k of the i-th item; members[t]: items of type t
+        variables = [[x[(uid, *position)] for position in self.positions[t]] for uid, _, t in typed]
+        members = [[] for _ in self.types]
+        for i, (_, _, t) in enumerate(typed):
+            members[t].append(i)
+
+        def le(terms, rhs):
+            prob.addConstraint(LpConstraint(LpAffineExpression(terms), LpConstraintLE, rhs=rhs))
+
+        prob.setObjective(LpAffineExpression({
+            var: coefficient
+            for i, (_, _, t) in enumerate(typed)
+            for var, coefficient in zip(variables[i], self.objective[t])
+        }))
+
+        # Each item can only be placed in one position
+        for i in range(len(typed)):
+            le({var: 1 for var in variables[i]}, 1)
+
+        # Items do not overlap
+        for placements in self.cover:
+            le({variables[j][k]: 1 for t, k in placements for j in members[t]}, 1)
+
+        def held_up(i, t):
+            # Every placement above the floor needs another item right below it
+            for k, supports in self.below[t]:
+                terms = {variables[j][q]: -1 for b, q in supports for j in members[b] if j != i}
+                terms[variables[i][k]] = 1
+                le(terms, 0)
+
+        tight = (formulation or FRAGILE_FORMULATION) == 'tight'
+        for i, (_, item, t) in enumerate(typed):
+            held_up(i, t)
+        if not tight:
+            for i, (_, item, t) in enumerate(typed):
+                if item.fragile:
+                    # Fragile items must be placed on the floor or fully supported
+                    held_up(i, t)
+        for i, (_, item, t) in enumerate(typed):
+            if not item.fragile:
+                continue
+            # Nothing rests on a fragile item
+            if tight:
+                for k, cliques in self.above_cliques(t):
+                    for b, group in cliques:
+                        others = [j for j in members[b] if j != i]
+                        if others:
+                            terms = {variables[j][q]: 1 for q in group for j in others}
+                            terms[variables[i][k]] = 1
+                            le(terms, 1)
+            else:
+                for k, resting in self.above[t]:
+                    terms = {variables[j][q]: 1 for b, q in resting for j in members[b] if j != i}
+                    terms[variables[i][k]] = FRAGILE_BIG_M
+                    le(terms, FRAGILE_BIG_M)
+        return x
+
+
+_templates = OrderedDict()
+_templates_lock = threading.Lock()
+
+
+def get_template(bin, items):
+    """The cached PackingTemplate for `bin` and the box sizes in `items`, built on first use."""
+    types = tuple(sorted({(item.length, item.width, item.height) for item in items}))
+    key = (bin.length, bin.width, bin.height, types)
+    with _templates_lock:
+        template = _templates.get(key)
+        if template is not None:
+            _templates.move_to_end(key)
+    metrics.packing_template_lookups.inc(result="hit" if template is not None else "miss")
+    if template is None:
+        template = PackingTemplate(bin.length, bin.width, bin.height, types)
+        with _templates_lock:
+            _templates[key] = template
+            while len(_templates) > TEMPLATE_CACHE_ENTRIES:
+                _templates.popitem(last=False)
+    return template
@@ -0,0 +1,299 @@
+import logging
+from optimizer import optimize_routes, distance_progress, build_distance_matrix
+from allocation import allocate_units
+from instance_snapshot import save_instance, capture_path
+from tracing import trace_request, span
+from deadline import Deadline
+from data_structures import Bin
+from converter import convert_pack_items
+
+# The /solve and /pack pipelines after the body has been parsed. They run inside
+# the Flask request, or inside a worker process for /jobs.
+
+logger = logging.getLogger('optisupply.pipeline')
+
+
+def tracing_options(data):
+    """
+    Read the optional "timings" field of a request: true, or an object such as
+    {"profile": true, "memory": true} ("profile" may also list span names).
+    """
+    options = data.get('timings') or False
+    if not isinstance(options, dict):
+        return bool(options), False, False
+    return True, options.get('profile', False), options.get('memory', False)
+
+def capture_instance(request_id, suppliers, warehouses, trucks, catalogue, orders, distances=None, assignments=None):
+    """
+    Save the request's problem instance with the distances the solve used (None
+    when it failed before they were known), plus its solution when there is one.
+    """
+    with span("snapshot") as snapshot_span:
+        if distances is None:
+            print(f"Snapshot {request_id} is saved without distances")
+        path = save_instance(capture_path(request_id), suppliers, warehouses, trucks, catalogue, orders,
+                             distances, assignments)
+        snapshot_span.attrs["path"] = path
+    return path
+
+def print_item_positions(bin):
+    positions = []
+    for item in bin.items:
+        if item.position is not None:
+            positions.append({
+                "id": item.id,
+                "position": item.position,
+                "dimensions": (item.length, item.width, item.height)
+            })
+    return positions
+
+def truck_to_json(truck):
+    return {
+        "truckId": truck.truck_id,
+        "items": [
+            {
+                "itemId": item.id,
+                "quantity_id": item.quantity_id,
+                "position": item.position,
+                "dimensions": (item.length, item.width, item.height),
+                "supplier": item.supplier_id,
+                "warehouse": item.warehouse_id
+            }
+            for item in truck.bin.items
+        ]
+    }
+
+def _group_units(truck_id, units):
+    """
+    Compact truck shape: units that share SKU, dimensions, supplier and warehouse
+    are one group, with their quantity ids and flat [x, y, z, x, y, z, ...] positions.
+    `units` yields (item_id, quantity_id, position, dimensions, supplier, warehouse).
+    """
+    groups = {}
+    for item_id, quantity_id, position, dimensions, supplier, warehouse in units:
+        key = (item_id, tuple(dimensions), supplier, warehouse)
+        group = groups.get(key)
+        if group is None:
+            group = groups[key] = {
+                "itemId": item_id,
+                "dimensions": dimensions,
+                "supplier": supplier,
+                "warehouse": warehouse,
+                "quantityIds": [],
+                "positions": [],
+            }
+        group["quantityIds"].append(quantity_id)
+        # Unplaced units keep their slot as three nulls
+        group["positions"].extend(position if position is not None else (None, None, None))
+    return {"truckId": truck_id, "groups": list(groups.values())}
+
+def truck_to_compact_json(truck):
+    return _group_units(truck.truck_id, (
+        (item.id, item.quantity_id, item.position, (item.length, item.width, item.height),
+         item.supplier_id, item.warehouse_id)
+        for item in truck.bin.items))
+
+def trucks_to_json(trucks):
+    logger.debug("Serialising trucks: %s", trucks)
+    return [truck_to_json(truck) for truck in trucks]
+
+def assignments_to_json(assignments):
+    return [
+        {"supplier": s_id, "warehouse": w_id, "itemId": i_id, "quantity_id": q_id}
+        for s_id, w_id, i_id, q_id, qty in assignments
+    ]
+
+def debug_data(suppliers, warehouses, trucks, items):
+    print("Suppliers:")
+    for s in suppliers:
+        print(f"  {s.supplier_id}: {s.location}")
+
+    print("\nWarehouses:")
+    for w in warehouses:
+        print(f"  {w.warehouse_id}: {w.location}")
+
+    print("\nTrucks:")
+    for t in trucks:
+        print(f"  {t.truck_id}: Capacity {t.bin.length, t.bin.width, t.bin.height}")
+
+    print("\nItems:")
+    for i in items:
+        print(f"  {i.id}-{i.quantity_id}: Volume {i.length, i.width, i.height}, Supplier {i.supplier_id}, Warehouse {i.warehouse_id}")
+
+
+    print("\nWarehouses Demand:")
+    for w in warehouses:
+        print(f"Warehouse {w.warehouse_id} Demand: {w.demand}")
+
+    print("\nSupplier Inventory:")
+    for s in suppliers:
+        print(f"Supplier {s.supplier_id} Inventory: {s.inventory}")
+
+
+def solve_payload(payload, request_id, capture=False, ingestion_span=None, listener=None, on_result=None,
+                  compact=False):
+    """
+    Allocate, optimise and serialise a parsed /solve payload.
+
+    Args:
+        payload (SolvePayload): Output of ingest.read_solve_payload.
+        request_id (str): Key for distance progress and the captured snapshot.
+        capture (bool): Save the problem instance even if the payload does not ask for it.
+        ingestion_span (Span, optional): Parsing span to report under the request's root span.
+        listener (callable, optional): Called with each span name as it opens (see tracing.Tracer).
+        on_result (callable, optional): Passed on to optimize_routes for partial results.
+        compact (bool): Serialise trucks with truck_to_compact_json.
+
+    Returns:
+        dict: The /solve response body.
+    """
+    report_timings, profile, trace_memory = tracing_options(payload)
+    # Dumping the inputs and results to stdout is opt-in, it dominates large requests
+    debug = bool(payload.get('debug'))
+    # "deadline_ms" bounds the whole solve; stages that run out of time degrade instead
+    deadline = Deadline.from_ms(payload.get('deadline_ms'))
+    with trace_request('solve', profile=profile, trace_memory=trace_memory, listener=listener) as tracer:
+        if ingestion_span is not None:
+            tracer.root.children.append(ingestion_span)
+        suppliers = payload.suppliers
+        trucks = payload.trucks
+        orders = payload.orders
+        warehouses = payload.warehouses
+        with span("conversion"):
+            catalogue = payload.catalogue
+        with span("allocation") as allocation_span:
+            # Only the ordered units are materialised, not every SKU x 100
+            items = allocate_units(orders, catalogue, warehouses)
+            allocation_span.attrs["units"] = len(items)
+
+        if debug:
+            debug_data(suppliers, warehouses, trucks, items)
+        capture = capture or bool(payload.get('captureSnapshot'))
+        snapshot_path = assignments = travel_distances = None
+        try:
+            # Built here so a captured snapshot holds exactly the distances the solve used,
+            # geodesic fallbacks included, instead of routing them again after the deadline
+            with span("distance_matrix", pairs=len(suppliers) * len(warehouses)):
+                travel_distances = build_distance_matrix(suppliers, warehouses, request_id, deadline)
+            assignments = optimize_routes(suppliers, warehouses, trucks, orders, items, request_id=request_id,
+                                          travel_distances=travel_distances, on_result=on_result, deadline=deadline,
+                                          portfolio=bool(payload.get('portfolio')),
+                                          blocks=bool(payload.get('blocks')),
+                                          heuristic_first=bool(payload.get('heuristic_first')))
+        finally:
+            distance_progress.pop(request_id, None)
+            if capture:
+                # Failed solves are captured too, they are the ones worth replaying
+                snapshot_path = capture_instance(request_id, suppliers, warehouses, trucks, catalogue, orders,
+                                                 travel_distances, assignments)
+        if debug:
+            for truck in trucks:
+                print(f"Truck {truck.truck_id} is carrying the following items:")
+                for item in truck.bin.items:
+                    print(f"Item {item.id}-{item.quantity_id} from Supplier {item.supplier_id} to Warehouse {item.warehouse_id} "
+                          f"at position {item.position} with dimensions {item.length}x{item.width}x{item.height}.")
+                print()
+        with span("serialization"):
+            if compact:
+                result = [truck_to_compact_json(truck) for truck in trucks]
+            else:
+                result=trucks_to_json(trucks)
+        if debug:
+            print(result)
+
+    tracer.log()
+    response = {'data':result, 'requestId': request_id}
+    if compact:
+        response['format'] = 'compact'
+    if deadline is not None:
+        response['deadlineMs'] = deadline.seconds * 1000
+        response['degraded'] = deadline.degraded
+    if snapshot_path is not None:
+        response['snapshot'] = snapshot_path
+    if report_timings:
+        response['timings'] = tracer.as_dict()
+    return response
+
+
+def pack_bin(bin_data, items_data, time_limit=None, debug=False, portfolio=False, blocks=False,
+             heuristic_first=False):
+    """
+    Pack one /pack style job.
+
+    Returns:
+        tuple: (positions, solver status, engine) where positions is the print_item_positions
+            list; the status is None when the heuristic engine packed the bin.
+    """
+    from item_placement import pack_items
+    from pulp import LpStatus
+
+    bin = Bin(bin_data['length'], bin_data['width'], bin_data['height'])
+    items = convert_pack_items(items_data)
+    if debug:
+        print(items)
+        print('#####')
+        print(bin.length,bin.height,bin.width)
+    with span("packing", items=len(items)):
+        engine, status = pack_items(bin, items, time_limit=time_limit, portfolio=portfolio, blocks=blocks,
+                                   heuristic_first=heuristic_first)
+    return print_item_positions(bin), LpStatus[status] if status is not None else None, engine
+
+
+def pack_payload(data):
+    """
+    Pack the items of a /pack request into its bin.
+
+    Returns:
+        dict: The /pack response body.
+    """
+    report_timings, profile, trace_memory = tracing_options(data)
+    with trace_request('pack', profile=profile, trace_memory=trace_memory) as tracer:
+        positions, _, engine = pack_bin(data['bin'], data['items'], debug=data.get('debug'),
+                                        portfolio=bool(data.get('portfolio')), blocks=bool(data.get('blocks')),
+                                        heuristic_first=bool(data.get('heuristic_first')))
+    tracer.log()
+    response = {"status": "success", "positions": positions, "engine": engine}
+    if report_timings:
+        response["timings"] = tracer.as_dict()
+    return response
+
+
+def insert_payload(data):
+    """
+    Add the "items" of a /pack/insert request to a bin already holding the
+    "loaded" items (each with its "position"), without moving those.
+
+    Returns:
+        dict: The /pack/insert response body.
+    """
+    from item_placement import insert_items, INSERT_REGION_TIME_LIMIT
+
+    bin_data = data['bin']
+    bin = Bin(bin_data['length'], bin_data['width'], bin_data['height'])
+    units_seen = {}
+    loaded = convert_pack_items(data['loaded'], units_seen)
+    for item in loaded:
+        x, y, z = item.position
+        if (min(x, y, z) < 0 or x + item.length > bin.length or y + item.width > bin.width
+                or z + item.height > bin.height):
+            raise ValueError(f"Loaded item {item.id} at {item.position} is outside the bin")
+    bin.items = loaded
+    items = convert_pack_items(data['items'], units_seen)
+
+    report_timings, profile, trace_memory = tracing_options(data)
+    with trace_request('pack_insert', profile=profile, trace_memory=trace_memory) as tracer:
+        method, _ = insert_items(bin, items, data.get('timeLimit', INSERT_REGION_TIME_LIMIT))
+    tracer.log()
+    in_bin = {id(item) for item in bin.items}
+    new = Bin(bin.length, bin.width, bin.height)
+    new.items = [item for item in items if id(item) in in_bin]
+    response = {
+        "status": "success",
+        "method": method,
+        "positions": print_item_positions(bin),
+        "inserted": print_item_positions(new),
+        "unplaced": [item.id for item in items if id(item) not in in_bin],
+    }
+    if report_timings:
+        response["timings"] = tracer.as_dict()
+    return response
@@ -0,0 +1,208 @@
+import os, queue, signal, time
+from tracing import span
+import metrics
+
+# Portfolio mode: the same model is solved by several engines or solver settings
+# at once, each in its own process. The first proven optimum wins and the other
+# contestants are stopped; otherwise the best result found by the end of the
+# budget is used. The heuristic runs first, in the calling process, and is the
+# result to beat.
+
+# Contestants per model: engine plus extra GUROBI_CMD parameters
+PACKING_PORTFOLIO = [
+    {"name": "exact", "engine": "exact", "options": []},
+    {"name": "warm_start", "engine": "warm_start", "options": []},
+    {"name": "feasibility_focus", "engine": "warm_start", "options": [("MIPFocus", 1)]},
+    {"name": "bound_focus", "engine": "exact", "options": [("MIPFocus", 3), ("Cuts", 2)]},
+]
+ROUTES_PORTFOLIO = [
+    {"name": "exact", "engine": "exact", "options": []},
+    {"name": "warm_start", "engine": "warm_start", "options": []},
+    {"name": "feasibility_focus", "engine": "warm_start", "options": [("MIPFocus", 1)]},
+    {"name": "barrier_root", "engine": "exact", "options": [("Method", 2)]},
+]
+
+# Contestants running at the same time
+PORTFOLIO_WORKERS = os.cpu_count() or 1
+
+# Time the race waits past the solver time limit for model building and result transfer (seconds)
+RACE_GRACE = 10
+
+# How often the race checks for contestants that died without reporting (seconds)
+POLL_INTERVAL = 1.0
+
+
+def _contestant(solve, index, config, args, time_limit, results):
+    """Process entry point: run one configuration and report its result."""
+    if hasattr(os, 'setsid'):
+        # Own process group, so stopping the contestant also stops its solver process
+        os.setsid()
+    started = time.perf_counter()
+    try:
+        result = solve(config, *args, time_limit)
+    except Exception as e:
+        result = {"error": f"{type(e).__name__}: {e}"}
+    result.update(index=index, seconds=time.perf_counter() - started)
+    results.put(result)
+
+
+def _stop(process):
+    if not process.is_alive():
+        return
+    try:
+        os.killpg(process.pid, signal.SIGTERM)
+    except (AttributeError, OSError):
+        # No process groups here, or the contestant has not made its own yet
+        process.terminate()
+    process.join(5)
+
+
+def race(model, solve, contestants, args, time_limit=None):
+    """
+    Run `solve(config, *args, time_limit)` for every contestant in its own process.
+
+    Returns:
+        list[dict]: The results received, in arrival order; the race ends early on
+            the first one with "optimal" set.
+    """
+    import multiprocessing
+
+    context = multiprocessing.get_context('spawn')
+    results = context.Queue()
+    contestants = contestants[:PORTFOLIO_WORKERS]
+    processes = [
+        context.Process(target=_contestant, args=(solve, index, config, args, time_limit, results), daemon=True)
+        for index, config in enumerate(contestants)
+    ]
+    finish_by = time.perf_counter() + time_limit + RACE_GRACE if time_limit is not None else None
+    received = []
+    with span("portfolio", model=model, contestants=len(processes)) as race_span:
+        for process in processes:
+            process.start()
+        try:
+            while len(received) < len(processes):
+                wait = POLL_INTERVAL
+                if finish_by is not None:
+                    wait = min(wait, finish_by - time.perf_counter())
+                    if wait <= 0:
+                        break
+                try:
+                    result = results.get(timeout=wait)
+                except queue.Empty:
+                    if not any(process.is_alive() for process in processes) and results.empty():
+                        break
+                    continue
+                result["name"] = contestants[result["index"]]["name"]
+                received.append(result)
+                if result.get("optimal"):
+                    break
+        finally:
+            for process in processes:
+                _stop(process)
+        race_span.attrs["received"] = len(received)
+    for result in received:
+        if "error" in result:
+            print(f"Portfolio {model} contestant {result['name']} failed: {result['error']}")
+    return [result for result in received if "error" not in result]
+
+
+def _pick(model, results, score):
+    """The best result by `score`, preferring proven optima."""
+    winner = max(results, key=lambda result: (bool(result.get("optimal")), score(result)))
+    metrics.portfolio_wins.inc(model=model, contestant=winner["name"])
+    print(f"Portfolio {model} won by {winner['name']} after {winner['seconds']:.2f}s")
+    return winner
+
+
+def _solve_packing(config, dims, items, time_limit):
+    from data_structures import Bin
+    from item_placement import optimize_packing, heuristic_start
+
+    bin = Bin(*dims)
+    warm_start = heuristic_start(bin, items) if config["engine"] == "warm_start" else None
+    started = time.perf_counter()
+    status = optimize_packing(bin, items, time_limit=time_limit, warm_start=warm_start,
+                              solver_options=config["options"])
+    return {
+        "status": status,
+        "optimal": status == 1 and (time_limit is None or time.perf_counter() - started < time_limit),
+        "placements": {f"{item.id}_{item.quantity_id}": item.position for item in bin.items},
+    }
+
+
+def race_packing(bin, items, time_limit=None):
+    """
+    Pack `items` into `bin` with every PACKING_PORTFOLIO configuration at once and
+    keep the placement that packs the most (the objective breaks ties).
+
+    Returns:
+        tuple: ("portfolio/<winner>", LpStatus code, or None when the heuristic won)
+    """
+    from data_structures import Bin
+    from heuristic_packing import extreme_point_packing
+
+    scratch = Bin(bin.length, bin.width, bin.height)
+    positions = [item.position for item in items]
+    extreme_point_packing(scratch, items)
+    baseline = {
+        "name": "heuristic", "status": None, "optimal": False, "seconds": 0.0,
+        "placements": {f"{item.id}_{item.quantity_id}": item.position for item in scratch.items},
+    }
+    for item, position in zip(items, positions):
+        item.position = position
+
+    def score(result):
+        placed = result["placements"].values()
+        return len(placed), sum(1 + 0.01 * x / bin.length for x, _, _ in placed)
+
+    results = [baseline]
+    if len(baseline["placements"]) < len(items):
+        # Everything already fits otherwise; only the tie-breaker could still improve
+        results += race("packing", _solve_packing, PACKING_PORTFOLIO,
+                        ((bin.length, bin.width, bin.height), items), time_limit)
+    winner = _pick("packing", results, score)
+    for item in items:
+        position = winner["placements"].get(f"{item.id}_{item.quantity_id}")
+        if position is not None:
+            item.position = tuple(position)
+            bin.items.append(item)
+    return f"portfolio/{winner['name']}", winner["status"]
+
+
+def _solve_assignment(config, suppliers, warehouses, items, travel_distances, time_limit):
+    from optimizer import solve_assignment, greedy_assignments
+
+    warm_start = greedy_assignments(suppliers, items, travel_distances) if config["engine"] == "warm_start" else None
+    started = time.perf_counter()
+    assignments, status = solve_assignment(suppliers, warehouses, items, travel_distances, time_limit, warm_start,
+                                           solver_options=config["options"], return_status=True)
+    if assignments is None:
+        return {"error": "no solution"}
+    return {
+        "assignments": assignments,
+        "optimal": status == 1 and (time_limit is None or time.perf_counter() - started < time_limit),
+    }
+
+
+def race_assignment(suppliers, warehouses, items, travel_distances, time_limit=None):
+    """
+    Solve the assignment MILP with every ROUTES_PORTFOLIO configuration at once and
+    keep the assignment covering the most units at the shortest total distance.
+
+    Returns:
+        tuple: (assignments, winner name, whether the winner is a proven optimum)
+    """
+    from optimizer import greedy_assignments
+
+    baseline = {"name": "greedy", "optimal": False, "seconds": 0.0,
+                "assignments": greedy_assignments(suppliers, items, travel_distances)}
+
+    def score(result):
+        assignments = result["assignments"]
+        distance = sum(travel_distances.get((s_id, w_id), float('inf')) for s_id, w_id, _, _, _ in assignments)
+        return len(assignments), -distance
+
+    results = [baseline] + race("routes", _solve_assignment, ROUTES_PORTFOLIO,
+                                (suppliers, warehouses, items, travel_distances), time_limit)
+    winner = _pick("routes", results, score)
+    return winner["assignments"], winner["name"], bool(winner.get("optimal"))
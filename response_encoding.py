@@ -0,0 +1,99 @@
+import json, zlib
+
+# Bodies smaller than this are sent uncompressed, the headers would cost more than they save (bytes)
+COMPRESS_MIN_BYTES = 1024
+
+# zlib level for gzip/deflate responses; higher levels cost a lot of CPU for little gain on JSON
+COMPRESS_LEVEL = 6
+
+# The streaming JSON writer hands the server chunks of about this size (bytes)
+WRITE_CHUNK_BYTES = 64 * 1024
+
+# Window bits selecting the zlib container for each Content-Encoding
+_WBITS = {'gzip': 16 + zlib.MAX_WBITS, 'deflate': zlib.MAX_WBITS}
+
+_encoder = None
+
+
+def dumps(value):
+    """Compact JSON (bytes), through orjson when it is installed."""
+    global _encoder
+    if _encoder is None:
+        try:
+            import orjson
+            _encoder = lambda value: orjson.dumps(value, default=str)
+        except ImportError:
+            encoder = json.JSONEncoder(separators=(',', ':'), default=str)
+            _encoder = lambda value: encoder.encode(value).encode()
+    return _encoder(value)
+
+
+def iter_json(response, chunk_size=WRITE_CHUNK_BYTES):
+    """
+    Write a response dict as JSON in chunks: list values (the trucks of a /solve
+    response) are encoded one element at a time, so the full body is never built
+    as one string and the first bytes leave before the last truck is encoded.
+    """
+    buffer = bytearray(b'{')
+    for n, (key, value) in enumerate(response.items()):
+        if n:
+            buffer += b','
+        buffer += dumps(str(key)) + b':'
+        if not isinstance(value, list):
+            buffer += dumps(value)
+            continue
+        buffer += b'['
+        for i, element in enumerate(value):
+            if i:
+                buffer += b','
+            buffer += dumps(element)
+            if len(buffer) >= chunk_size:
+                yield bytes(buffer)
+                buffer.clear()
+        buffer += b']'
+    buffer += b'}'
+    yield bytes(buffer)
+
+
+def negotiate_encoding(accept_encoding):
+    """Pick gzip or deflate from an Accept-Encoding header, or None for identity."""
+    offered = {}
+    for part in (accept_encoding or '').split(','):
+        name, _, params = part.strip().partition(';')
+        quality = 1.0
+        params = params.strip()
+        if params.startswith('q='):
+            try:
+                quality = float(params[2:])
+            except ValueError:
+                quality = 0.0
+        offered[name.strip().lower()] = quality
+    for encoding in ('gzip', 'deflate'):
+        if offered.get(encoding, offered.get('*', 0)) > 0:
+            return encoding
+    return None
+
+
+def compress(data, encoding):
+    compressor = zlib.compressobj(COMPRESS_LEVEL, zlib.DEFLATED, _WBITS[encoding])
+    return compressor.compress(data) + compressor.flush()
+
+
+def compress_stream(chunks, encoding):
+    """
+    Compress a streamed body. Every chunk is flushed on its own, so NDJSON lines and
+    SSE events still reach the client as soon as they are produced.
+    """
+    compressor = zlib.compressobj(COMPRESS_LEVEL, zlib.DEFLATED, _WBITS[encoding])
+    try:
+        for chunk in chunks:
+            if isinstance(chunk, str):
+                chunk = chunk.encode()
+            data = compressor.compress(chunk) + compressor.flush(zlib.Z_SYNC_FLUSH)
+            if data:
+                yield data
+        yield compressor.flush()
+    finally:
+        close = getattr(chunks, 'close', None)
+        if close is not None:
+            close()
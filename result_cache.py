@@ -0,0 +1,142 @@
+import hashlib, json, threading, time
+from collections import OrderedDict
+from concurrent.futures import Future
+import metrics
+
+# Finished results are served for this long after they were computed (seconds)
+RESULT_TTL = 600
+
+# Results kept per endpoint; the least recently used is evicted first
+RESULT_CACHE_ENTRIES = 256
+
+# Request fields that do not change the result and are left out of the key
+IGNORED_FIELDS = frozenset(['requestId', 'timings', 'debug', 'captureSnapshot'])
+
+
+_encoder = None
+
+
+def _dumps(value):
+    """Compact JSON with sorted keys, through orjson when it is installed."""
+    global _encoder
+    if _encoder is None:
+        try:
+            import orjson
+            options = orjson.OPT_SORT_KEYS | orjson.OPT_NON_STR_KEYS
+            _encoder = lambda value: orjson.dumps(value, option=options, default=str)
+        except ImportError:
+            encoder = json.JSONEncoder(sort_keys=True, separators=(',', ':'), default=str)
+            _encoder = lambda value: encoder.encode(value).encode()
+    return _encoder(value)
+
+
+def _normalize(value):
+    """Sort every nested array by the encoding of its elements, so element order does not matter."""
+    if isinstance(value, dict):
+        return {key: _normalize(item) if isinstance(item, (dict, list)) else item for key, item in value.items()}
+    items = [_normalize(item) if isinstance(item, (dict, list)) else item for item in value]
+    return sorted(items, key=_dumps) if len(items) > 1 else items
+
+
+def canonical_json(value):
+    """Encoding of a JSON value that ignores key order and array order (bytes)."""
+    return _dumps(_normalize(value) if isinstance(value, (dict, list)) else value)
+
+
+def request_key(data):
+    """Order-insensitive hash of a whole JSON request body."""
+    body = {key: value for key, value in data.items() if key not in IGNORED_FIELDS}
+    return hashlib.sha256(canonical_json(body)).hexdigest()
+
+
+class RecordDigest:
+    """
+    Order-insensitive hash built one record at a time, so a streamed body can be
+    keyed without keeping it: only each record's SHA-256 digest (32 bytes) is
+    kept, and the key hashes the sorted digests. Any order of the same multiset
+    of records gives the same key. Sorting keeps the key collision resistant;
+    summing digests (AdHash) would let crafted record sets collide.
+    """
+
+    def __init__(self):
+        self.digests = []
+
+    @property
+    def count(self):
+        return len(self.digests)
+
+    def add(self, section, record):
+        self.digests.append(hashlib.sha256(section.encode() + b':' + canonical_json(record)).digest())
+
+    def key(self, options=None):
+        options = {key: value for key, value in (options or {}).items() if key not in IGNORED_FIELDS}
+        digest = hashlib.sha256(f"{self.count}:".encode())
+        for record_digest in sorted(self.digests):
+            digest.update(record_digest)
+        digest.update(canonical_json(options))
+        return digest.hexdigest()
+
+
+class ResultCache:
+    """
+    TTL + LRU cache of endpoint results with in-flight de-duplication: while a
+    key is being computed, identical requests wait for that computation instead
+    of starting their own. Failures are passed to the waiters but not cached.
+    """
+
+    def __init__(self, name, ttl=RESULT_TTL, max_entries=RESULT_CACHE_ENTRIES):
+        self.name = name
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.entries = OrderedDict()  # key -> (stored_at, result)
+        self.in_flight = {}  # key -> Future
+        self.lock = threading.Lock()
+
+    def get_or_compute(self, key, compute):
+        """
+        Return (result, source) where source is "hit", "shared" (waited for an
+        identical request already running) or "miss" (computed here).
+        """
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None and time.time() - entry[0] < self.ttl:
+                self.entries.move_to_end(key)
+                source = 'hit'
+            else:
+                if entry is not None:
+                    del self.entries[key]
+                future = self.in_flight.get(key)
+                if future is None:
+                    future = self.in_flight[key] = Future()
+                    source = 'miss'
+                else:
+                    source = 'shared'
+        metrics.result_cache_lookups.inc(endpoint=self.name, result=source)
+
+        if source == 'hit':
+            return entry[1], source
+        if source == 'shared':
+            return future.result(), source
+
+        try:
+            result = compute()
+        except BaseException as e:
+            with self.lock:
+                del self.in_flight[key]
+            future.set_exception(e)
+            raise
+        with self.lock:
+            del self.in_flight[key]
+            self.entries[key] = (time.time(), result)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+        future.set_result(result)
+        return result, source
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+
+solve_results = ResultCache('solve')
+pack_results = ResultCache('pack')
@@ -0,0 +1,167 @@
+import pickle, os
+
+# File to store the location -> road node mapping (kept next to the distance cache)
+SNAP_CACHE_FILE = 'node_snap_cache.pkl'
+
+# Padding in degrees around the locations when downloading the road graph
+BBOX_MARGIN = 0.1
+
+# Loaded from SNAP_CACHE_FILE on first use, see get_node_cache
+node_cache = None
+
+# Shared projected road graph and its spatial index, built once and reused
+_graph = None
+_graph_bbox = None
+_snapper = None
+_ox = None
+
+
+def load_osmnx():
+    """Import osmnx on first use and point it at the local cache directory."""
+    global _ox
+    if _ox is None:
+        import osmnx as ox
+        # Set up OSMnx to use the cache directory
+        ox.settings.use_cache = True
+        ox.settings.cache_folder = 'C:\\Users\\arpan\\OneDrive\\Desktop\\logistics_project\\osmnx_cache'
+        _ox = ox
+    return _ox
+
+
+def get_node_cache():
+    global node_cache
+    if node_cache is None:
+        # Load existing snapping cache from file if it exists
+        if os.path.exists(SNAP_CACHE_FILE):
+            with open(SNAP_CACHE_FILE, 'rb') as f:
+                node_cache = pickle.load(f)
+        else:
+            node_cache = {}
+    return node_cache
+
+
+def _bbox_for(locations):
+    latitudes = [loc[0] for loc in locations]
+    longitudes = [loc[1] for loc in locations]
+    return (max(latitudes) + BBOX_MARGIN, min(latitudes) - BBOX_MARGIN,
+            max(longitudes) + BBOX_MARGIN, min(longitudes) - BBOX_MARGIN)
+
+
+def _covers(outer, inner):
+    return (outer[0] >= inner[0] and outer[1] <= inner[1] and
+            outer[2] >= inner[2] and outer[3] <= inner[3])
+
+
+def road_graph_covers(locations):
+    """Whether the road graph in memory already covers `locations` (no download needed)."""
+    return _graph is not None and _covers(_graph_bbox, _bbox_for(locations))
+
+
+def get_road_graph(locations):
+    """
+    Return the shared projected drive graph, downloading it only when the
+    requested locations fall outside the area it already covers.
+
+    Args:
+        locations (list[tuple]): (latitude, longitude) pairs that must be covered.
+
+    Returns:
+        networkx.MultiDiGraph: The projected road graph.
+    """
+    global _graph, _graph_bbox, _snapper
+
+    bbox = _bbox_for(locations)
+    if _graph is None or not _covers(_graph_bbox, bbox):
+        if _graph_bbox is not None:
+            # Grow the covered area instead of replacing it
+            bbox = (max(bbox[0], _graph_bbox[0]), min(bbox[1], _graph_bbox[1]),
+                    max(bbox[2], _graph_bbox[2]), min(bbox[3], _graph_bbox[3]))
+        north, south, east, west = bbox
+        print(f"Building road graph for bbox {bbox}")
+        ox = load_osmnx()
+        # This will use the OSMnx cache if available
+        G = ox.graph_from_bbox(north, south, east, west, network_type='drive')
+        _graph = ox.project_graph(G)
+        _graph_bbox = bbox
+        _snapper = None
+    return _graph
+
+
+class NodeSnapper:
+    """KD-tree over the projected node coordinates of a road graph."""
+
+    def __init__(self, G):
+        import numpy as np
+        from pyproj import Transformer
+        from scipy.spatial import cKDTree
+
+        self.graph = G
+        nodes = list(G.nodes(data=True))
+        self.node_ids = np.array([node for node, _ in nodes])
+        self.tree = cKDTree(np.array([(data['x'], data['y']) for _, data in nodes]))
+        self.transformer = Transformer.from_crs('EPSG:4326', G.graph['crs'], always_xy=True)
+
+    def snap(self, locations):
+        """
+        Find the nearest road node for every location in one vectorized query.
+
+        Args:
+            locations (list[tuple]): (latitude, longitude) pairs.
+
+        Returns:
+            list: Node ids, in the same order as the locations.
+        """
+        import numpy as np
+
+        coords = np.asarray(locations, dtype=float).reshape(-1, 2)
+        xs, ys = self.transformer.transform(coords[:, 1], coords[:, 0])
+        _, idx = self.tree.query(np.column_stack([xs, ys]))
+        return self.node_ids[idx].tolist()
+
+
+def get_snapper(G):
+    global _snapper
+    if _snapper is None or _snapper.graph is not G:
+        _snapper = NodeSnapper(G)
+    return _snapper
+
+
+def snap_locations(locations, G=None):
+    """
+    Map locations to their nearest road nodes, reusing the persisted mapping and
+    snapping all unknown locations in a single batch.
+
+    Args:
+        locations (list[tuple]): (latitude, longitude) pairs.
+        G (networkx.MultiDiGraph, optional): Graph to snap against. Defaults to
+            the shared road graph covering the locations.
+
+    Returns:
+        list: Node ids, in the same order as the locations.
+    """
+    if G is None:
+        G = get_road_graph(locations)
+
+    node_cache = get_node_cache()
+    # Cached nodes that are missing from the current graph are snapped again
+    missing = [loc for loc in dict.fromkeys(locations)
+               if loc not in node_cache or node_cache[loc] not in G]
+    if missing:
+        nodes = get_snapper(G).snap(missing)
+        node_cache.update(zip(missing, nodes))
+        save_snap_cache()
+
+    return [node_cache[loc] for loc in locations]
+
+
+def save_snap_cache():
+    with open(SNAP_CACHE_FILE, 'wb') as f:
+        pickle.dump(get_node_cache(), f)
+
+
+# Function to clear the snapping cache (call this if the road data changes)
+def clear_snap_cache():
+    get_node_cache().clear()
+    if os.path.exists(SNAP_CACHE_FILE):
+        os.remove(SNAP_CACHE_FILE)
+    print("Node snapping cache cleared")
@@ -0,0 +1,103 @@
+import json, queue, threading
+from pipeline import solve_payload, truck_to_json, truck_to_compact_json, assignments_to_json
+import metrics
+
+# Streamed /solve responses: the shipment assignment is sent as soon as the MILP
+# is solved, then one event per truck as its packing finishes. Every event is a
+# JSON object with an "event" field:
+#   stage        {"stage": span name}             the solve moved on to a new stage
+#   assignments  {"assignments": [...]}           supplier/warehouse for every unit
+#   truck        {"truck": {...}}                 same shape as an entry of /solve "data" (compact too);
+#                                                 a later event for the same truckId replaces it
+#   done         {"requestId", "snapshot"?, "timings"?}
+#   error        {"message"}
+# Trucks that were never loaded are sent (empty) just before "done", so the
+# truck events add up to the /solve "data" list.
+
+# Content types of the two wire formats
+STREAM_FORMATS = {
+    'ndjson': 'application/x-ndjson',
+    'sse': 'text/event-stream',
+}
+
+# An SSE comment is sent after this long without events, so proxies keep the connection open (seconds)
+HEARTBEAT_INTERVAL = 15
+
+
+class StreamClosed(Exception):
+    """Raised at a stage boundary once the client has gone; args[0] is the stage."""
+    pass
+
+
+def stream_format(query_format, accept):
+    """The format a /solve request asked for with ?stream= or its Accept header, or None."""
+    if query_format in STREAM_FORMATS:
+        return query_format
+    for name, mimetype in STREAM_FORMATS.items():
+        if mimetype in (accept or ''):
+            return name
+    return None
+
+
+def encode_event(event, fmt):
+    data = json.dumps(event, default=str)
+    if fmt == 'sse':
+        return f"event: {event['event']}\ndata: {data}\n\n"
+    return data + "\n"
+
+
+def solve_events(payload, request_id, fmt, capture=False, ingestion_span=None, compact=False):
+    """
+    Solve a parsed /solve payload on a background thread and yield its events,
+    encoded for `fmt`, as they happen. If the client goes away, the solve stops at
+    its next stage boundary (a solver already running is not interrupted).
+    """
+    events = queue.Queue()
+    serialise = truck_to_compact_json if compact else truck_to_json
+    closed = threading.Event()
+    sent = set()
+
+    def listener(name):
+        if closed.is_set():
+            raise StreamClosed(name)
+        events.put({"event": "stage", "stage": name})
+
+    def on_result(kind, value):
+        if kind == "assignments":
+            events.put({"event": "assignments", "assignments": assignments_to_json(value)})
+        else:
+            sent.add(value.truck_id)
+            events.put({"event": "truck", "truck": serialise(value)})
+
+    def run():
+        try:
+            response = solve_payload(payload, request_id, capture=capture, ingestion_span=ingestion_span,
+                                     listener=listener, on_result=on_result, compact=compact)
+        except StreamClosed as e:
+            metrics.streams_closed.inc(stage=e.args[0])
+        except Exception as e:
+            events.put({"event": "error", "message": f"{type(e).__name__}: {e}"})
+        else:
+            for truck in response['data']:
+                if truck["truckId"] not in sent:
+                    events.put({"event": "truck", "truck": truck})
+            done = {key: value for key, value in response.items() if key != 'data'}
+            events.put({"event": "done", **done})
+        finally:
+            events.put(None)
+
+    worker = threading.Thread(target=run, name=f"solve-stream-{request_id}", daemon=True)
+    worker.start()
+    try:
+        while True:
+            try:
+                event = events.get(timeout=HEARTBEAT_INTERVAL)
+            except queue.Empty:
+                if fmt == 'sse':
+                    yield ": keep-alive\n\n"
+                continue
+            if event is None:
+                return
+            yield encode_event(event, fmt)
+    finally:
+        closed.set()
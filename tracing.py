@@ -0,0 +1,178 @@
+import io, json, logging, threading, time
+from contextlib import contextmanager
+
+# File the per-request timing trees are appended to
+TIMINGS_LOG = 'timings.log'
+
+# Number of functions kept from a cProfile capture
+PROFILE_TOP = 25
+
+logger = logging.getLogger('optisupply.timings')
+
+# The tracer of the request handled by the current thread
+_local = threading.local()
+
+
+class Span:
+    def __init__(self, name, attrs=None):
+        self.name = name
+        self.attrs = dict(attrs or {})
+        self.children = []
+        self.wall = 0.0
+        self.cpu = 0.0
+        self.memory_peak = None
+        self.profile = None
+
+    def as_dict(self):
+        data = {
+            "name": self.name,
+            "wall_ms": round(self.wall * 1000, 3),
+            "cpu_ms": round(self.cpu * 1000, 3),
+        }
+        if self.attrs:
+            data["attrs"] = self.attrs
+        if self.memory_peak is not None:
+            data["memory_peak_kb"] = round(self.memory_peak / 1024, 1)
+        if self.profile is not None:
+            data["profile"] = self.profile
+        if self.children:
+            data["children"] = [child.as_dict() for child in self.children]
+        return data
+
+
+class Tracer:
+    """
+    Records a tree of nested spans with wall/CPU time for one request.
+
+    Args:
+        profile (bool | list[str]): Capture cProfile stats for the whole request (True)
+            or for the named spans only.
+        trace_memory (bool): Record the tracemalloc peak of every span.
+        listener (callable, optional): Called with the span name whenever a span opens,
+            e.g. to publish the current stage of a background job. Exceptions it
+            raises abort the span.
+    """
+
+    def __init__(self, name='request', profile=False, trace_memory=False, listener=None):
+        self.root = Span(name)
+        self.profile = profile
+        self.trace_memory = trace_memory
+        self.listener = listener
+        self._stack = []
+        self._profiling = False
+
+    @contextmanager
+    def span(self, name, **attrs):
+        if self.listener is not None:
+            self.listener(name)
+        span = Span(name, attrs)
+        parent = self._stack[-1] if self._stack else None
+        if parent is not None:
+            parent.children.append(span)
+        self._stack.append(span)
+
+        # cProfile, pstats and tracemalloc are only imported when a request asks for them
+        profiler = None
+        wants_profile = self.profile is True and parent is None or (
+            isinstance(self.profile, (list, tuple, set)) and name in self.profile)
+        if wants_profile and not self._profiling:
+            import cProfile
+            profiler = cProfile.Profile()
+            self._profiling = True
+            profiler.enable()
+
+        if self.trace_memory:
+            import tracemalloc
+            if not tracemalloc.is_tracing():
+                tracemalloc.start()
+            if parent is not None:
+                # Resetting the peak for this span would hide the parent's peak so far
+                parent.memory_peak = max(parent.memory_peak or 0, tracemalloc.get_traced_memory()[1])
+            tracemalloc.reset_peak()
+
+        wall_start, cpu_start = time.perf_counter(), time.process_time()
+        try:
+            yield span
+        finally:
+            span.wall = time.perf_counter() - wall_start
+            span.cpu = time.process_time() - cpu_start
+            if self.trace_memory:
+                import tracemalloc
+                peak = tracemalloc.get_traced_memory()[1]
+                span.memory_peak = max(span.memory_peak or 0, peak,
+                                       *(child.memory_peak or 0 for child in span.children))
+                if parent is None:
+                    tracemalloc.stop()
+            if profiler is not None:
+                profiler.disable()
+                self._profiling = False
+                span.profile = _profile_summary(profiler)
+            self._stack.pop()
+
+    def current(self):
+        return self._stack[-1] if self._stack else self.root
+
+    def as_dict(self):
+        return self.root.as_dict()
+
+    def log(self):
+        if not logger.handlers:
+            logger.addHandler(logging.FileHandler(TIMINGS_LOG))
+            logger.setLevel(logging.INFO)
+        logger.info(json.dumps(self.as_dict(), default=str))
+
+
+def _profile_summary(profiler):
+    import pstats
+
+    stream = io.StringIO()
+    pstats.Stats(profiler, stream=stream).sort_stats('cumulative').print_stats(PROFILE_TOP)
+    return stream.getvalue().splitlines()
+
+
+@contextmanager
+def trace_request(name='request', profile=False, trace_memory=False, listener=None):
+    """Install a tracer for the current thread and open its root span."""
+    tracer = Tracer(name, profile=profile, trace_memory=trace_memory, listener=listener)
+    previous = getattr(_local, 'tracer', None)
+    _local.tracer = tracer
+    try:
+        with tracer.span(name) as root:
+            tracer.root = root
+            yield tracer
+    finally:
+        _local.tracer = previous
+
+
+def current_tracer():
+    return getattr(_local, 'tracer', None)
+
+
+@contextmanager
+def span(name, **attrs):
+    """
+    Time a block as a child of the current span. Outside a traced request the
+    span is timed but not attached to anything, so library code can be
+    instrumented unconditionally.
+    """
+    tracer = current_tracer()
+    if tracer is None:
+        detached = Span(name, attrs)
+        wall_start, cpu_start = time.perf_counter(), time.process_time()
+        try:
+            yield detached
+        finally:
+            detached.wall = time.perf_counter() - wall_start
+            detached.cpu = time.process_time() - cpu_start
+        return
+    with tracer.span(name, **attrs) as current:
+        yield current
+
+
+def model_size(prob):
+    """Rows, columns and nonzeros of a PuLP problem, for attaching to a span."""
+    return {
+        "rows": prob.numConstraints(),
+        "cols": prob.numVariables(),
+        "nonzeros": sum(len(constraint) for constraint in prob.constraints.values()),
+    }
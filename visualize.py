@@ -1,10 +1,8 @@
-import matplotlib.pyplot as plt
-from mpl_toolkits.mplot3d.art3d import Poly3DCollection
-from matplotlib.path import Path
-from mpl_toolkits.mplot3d import proj3d
-import matplotlib.colors as mcolors
+# matplotlib is only imported when something is actually drawn
 
 def plot_cuboid(ax, x, y, z, dx, dy, dz, edge_color='black', face_color='gray', alpha=0.5):
+    from mpl_toolkits.mplot3d.art3d import Poly3DCollection
+
     xx = [x, x, x+dx, x+dx, x]
     yy = [y, y+dy, y+dy, y, y]
     zz = [z, z, z, z, z]
@@ -25,6 +23,12 @@ def plot_cuboid(ax, x, y, z, dx, dy, dz, edge_color='black', face_color='gray',
     return poly
 
 def visualize_packing(bin):
+    import matplotlib.pyplot as plt
+    from mpl_toolkits.mplot3d.art3d import Poly3DCollection
+    from matplotlib.path import Path
+    from mpl_toolkits.mplot3d import proj3d
+    import matplotlib.colors as mcolors
+
     fig = plt.figure(figsize=(15, 10))
     ax = fig.add_subplot(111, projection='3d')
 